@@ -1,20 +1,102 @@
 """
-Agentic Verifier - Multi-step verification with reasoning model
+Agentic Verifier - Multi-step verification with a structured-output model
 Ensures zero hallucination through iterative refinement
 """
-import json
-from typing import Dict, Any, List, Optional
-from openai import OpenAI
+import re
+import asyncio
+import logging
+import string
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
+from cachetools import TTLCache
+import orjson
+import tiktoken
 
 from config import (
-    OPENAI_API_KEY,
     REASONING_MODEL,
     MAX_VERIFICATION_ATTEMPTS,
     CONFIDENCE_THRESHOLD,
-    TOP_K_RETRIEVAL
+    TOP_K_RETRIEVAL,
+    RERANK_CANDIDATES,
+    VERIFIER_CONTEXT_TOKEN_BUDGET,
+    MULTI_QUERY_PARAPHRASES,
+    SPECULATIVE_DRAFTS,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL
 )
+from openai_clients import get_async_openai_client
 from rag_engine import get_rag_engine
+from vector_store import VectorStore
+
+logger = logging.getLogger("ragapi.verifier")
+
+
+# Verification prompt; compiled into a string.Template once per verifier
+VERIFY_PROMPT = """You are a rigorous medical fact-checker. Your task is to verify if an answer is accurate and well-supported by the provided context.
+
+DISEASE CONTEXT: $disease
+
+ORIGINAL QUESTION: $query
+
+PROVIDED CONTEXT:
+$context
+
+ANSWER TO VERIFY:
+$answer
+
+VERIFICATION TASK:
+1. Check if EVERY claim in the answer is directly supported by the context
+2. Identify any statements that go beyond the provided context
+3. Check for potential hallucinations or unsupported inferences
+4. Verify medical terminology and facts are accurate
+5. Assess overall answer quality and completeness
+
+Respond with a JSON object:
+{
+    "is_verified": true/false,
+    "confidence": 0.0-1.0,
+    "supported_claims": ["list of claims that are well-supported"],
+    "unsupported_claims": ["list of claims not in context"],
+    "issues": ["specific problems found"],
+    "suggestions": ["how to improve the answer"],
+    "reasoning": "detailed explanation of your verification"
+}
+
+Be strict - medical information must be precise."""
+
+# Paraphrase styles used to widen first-attempt retrieval
+PARAPHRASE_STYLES = [
+    "Use precise medical terminology and name the specific clinical concepts involved.",
+    "Use plain everyday language and broaden it to closely related aspects of the topic.",
+]
+
+# Structured output schema for verification responses
+VERIFICATION_SCHEMA = {
+    "name": "verification_result",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "is_verified": {"type": "boolean"},
+            "confidence": {"type": "number"},
+            "supported_claims": {"type": "array", "items": {"type": "string"}},
+            "unsupported_claims": {"type": "array", "items": {"type": "string"}},
+            "issues": {"type": "array", "items": {"type": "string"}},
+            "suggestions": {"type": "array", "items": {"type": "string"}},
+            "reasoning": {"type": "string"}
+        },
+        "required": [
+            "is_verified",
+            "confidence",
+            "supported_claims",
+            "unsupported_claims",
+            "issues",
+            "suggestions",
+            "reasoning"
+        ],
+        "additionalProperties": False
+    }
+}
 
 
 @dataclass
@@ -34,10 +116,22 @@ class AgenticVerifier:
     """
 
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = get_async_openai_client()
         self.rag_engine = get_rag_engine()
+        self._verify_tmpl = string.Template(VERIFY_PROMPT)
+        self.encoding = tiktoken.encoding_for_model(REASONING_MODEL)
+
+        # Answers for repeated questions, invalidated per disease by version bump
+        self._answer_cache = TTLCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+        self._disease_versions: Dict[str, int] = {}
 
-    def verify_answer(
+    def invalidate_disease(self, disease_name: str):
+        """Drop cached answers for a disease after its documents change"""
+        # Keyed by collection name, so every spelling of a disease shares entries
+        collection_name = VectorStore._sanitize_name(disease_name)
+        self._disease_versions[collection_name] = self._disease_versions.get(collection_name, 0) + 1
+
+    async def verify_answer(
         self,
         query: str,
         answer: str,
@@ -45,7 +139,7 @@ class AgenticVerifier:
         disease_name: str
     ) -> VerificationResult:
         """
-        Verify an answer using the reasoning model
+        Verify an answer using the verification model
 
         Args:
             query: Original user query
@@ -56,59 +150,40 @@ class AgenticVerifier:
         Returns:
             VerificationResult with confidence and issues
         """
-        # Build context for verification
-        context_str = "\n\n---\n\n".join([
-            f"[Chunk {i + 1}]: {chunk.get('text', chunk.get('excerpt', ''))}"
-            for i, chunk in enumerate(context)
-        ])
-
-        verification_prompt = f"""You are a rigorous medical fact-checker. Your task is to verify if an answer is accurate and well-supported by the provided context.
-
-DISEASE CONTEXT: {disease_name}
-
-ORIGINAL QUESTION: {query}
-
-PROVIDED CONTEXT:
-{context_str}
-
-ANSWER TO VERIFY:
-{answer}
-
-VERIFICATION TASK:
-1. Check if EVERY claim in the answer is directly supported by the context
-2. Identify any statements that go beyond the provided context
-3. Check for potential hallucinations or unsupported inferences
-4. Verify medical terminology and facts are accurate
-5. Assess overall answer quality and completeness
-
-Respond with a JSON object:
-{{
-    "is_verified": true/false,
-    "confidence": 0.0-1.0,
-    "supported_claims": ["list of claims that are well-supported"],
-    "unsupported_claims": ["list of claims not in context"],
-    "issues": ["specific problems found"],
-    "suggestions": ["how to improve the answer"],
-    "reasoning": "detailed explanation of your verification"
-}}
-
-Be strict - medical information must be precise."""
+        # Build context for verification, keeping chunks in ranked order
+        # until the token budget is spent
+        context_parts = []
+        context_tokens = 0
+        # Labelled like the generation context so [Source N] citations resolve
+        for i, chunk in enumerate(context, start=1):
+            part = f"[Source {i}]: {chunk.get('text', chunk.get('excerpt', ''))}"
+            context_tokens += len(self.encoding.encode_ordinary(part))
+            if context_parts and context_tokens > VERIFIER_CONTEXT_TOKEN_BUDGET:
+                break
+            context_parts.append(part)
+
+        context_str = "\n\n---\n\n".join(context_parts)
+
+        verification_prompt = self._verify_tmpl.substitute(
+            disease=disease_name,
+            query=query,
+            context=context_str,
+            answer=answer
+        )
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=REASONING_MODEL,
                 messages=[
                     {"role": "user", "content": verification_prompt}
                 ],
-                max_completion_tokens=4096
+                response_format={"type": "json_schema", "json_schema": VERIFICATION_SCHEMA},
+                temperature=0,
+                max_tokens=4096
             )
 
-            # Parse response
-            content = response.choices[0].message.content
-
-            # Extract JSON from response
-            json_str = self._extract_json(content)
-            result = json.loads(json_str)
+            # Structured output guarantees a JSON object matching the schema
+            result = orjson.loads(response.choices[0].message.content)
 
             return VerificationResult(
                 is_verified=result.get("is_verified", False),
@@ -128,56 +203,59 @@ Be strict - medical information must be precise."""
                 reasoning="Verification failed due to technical error"
             )
 
-    def _extract_json(self, content: str) -> str:
-        """Extract JSON from model response"""
-        # Try to find JSON in the response
-        start_idx = content.find('{')
-        end_idx = content.rfind('}') + 1
-
-        if start_idx != -1 and end_idx > start_idx:
-            return content[start_idx:end_idx]
-
-        raise ValueError("No valid JSON found in response")
-
-    def refine_query(
+    async def refine_query(
         self,
         original_query: str,
         previous_answer: str,
-        verification_result: VerificationResult,
         disease_name: str,
-        attempt: int
+        attempt: int,
+        verification_result: Optional[VerificationResult] = None
     ) -> str:
         """
         Generate a refined query based on verification feedback
 
+        When no verification result is given, the refinement is speculative:
+        it is computed from the previous answer alone so it can run while
+        that answer is still being verified.
+
         Args:
             original_query: Original user query
             previous_answer: Previous answer that failed verification
-            verification_result: Result of verification
             disease_name: Disease context
             attempt: Current attempt number
+            verification_result: Result of verification, if already known
 
         Returns:
             Refined query string
         """
-        refinement_prompt = f"""Based on a failed answer verification, generate an improved search query.
+        if verification_result is not None:
+            task = "Based on a failed answer verification, generate an improved search query."
+            feedback = f"""Previous Answer Issues:
+{chr(10).join(f"- {issue}" for issue in verification_result.issues)}
+
+Suggestions:
+{chr(10).join(f"- {s}" for s in verification_result.suggestions)}"""
+            focus = "Focus on the specific information gaps identified."
+        else:
+            task = "An answer to this question is still being verified. Generate an alternative search query to use if it fails."
+            feedback = f"""Previous Answer:
+{previous_answer}"""
+            focus = "Focus on parts of the question the previous answer leaves out or answers vaguely."
+
+        refinement_prompt = f"""{task}
 
 Original Question: {original_query}
 Disease: {disease_name}
 Attempt: {attempt} of {MAX_VERIFICATION_ATTEMPTS}
 
-Previous Answer Issues:
-{chr(10).join(f"- {issue}" for issue in verification_result.issues)}
-
-Suggestions:
-{chr(10).join(f"- {s}" for s in verification_result.suggestions)}
+{feedback}
 
 Generate a more specific or differently-phrased query that might retrieve better context.
-Focus on the specific information gaps identified.
+{focus}
 
 Return ONLY the refined query, nothing else."""
 
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "user", "content": refinement_prompt}
@@ -188,7 +266,73 @@ Return ONLY the refined query, nothing else."""
 
         return response.choices[0].message.content.strip()
 
-    def agentic_query(
+    async def paraphrase_query(self, query: str, disease_name: str, style: str) -> str:
+        """
+        Rephrase a query in the given style to widen retrieval
+
+        Args:
+            query: Original user query
+            disease_name: Disease context
+            style: How the paraphrase should differ from the original
+
+        Returns:
+            Paraphrased query string
+        """
+        paraphrase_prompt = f"""Rewrite this question about {disease_name} as a search query.
+{style}
+
+Question: {query}
+
+Return ONLY the rewritten query, nothing else."""
+
+        response = await self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "user", "content": paraphrase_prompt}
+            ],
+            temperature=0.3,
+            max_tokens=200
+        )
+
+        return response.choices[0].message.content.strip()
+
+    async def _retrieve_candidates(self, disease_name: str, query: str) -> List[Dict[str, Any]]:
+        """
+        Retrieve the reranking candidate pool for a query
+
+        The original query and its paraphrases are searched concurrently and
+        the results merged by chunk ID, so answers that need differently
+        worded context can pass on the first attempt.
+        """
+        def retrieve(q: str):
+            return asyncio.to_thread(
+                self.rag_engine.retrieve,
+                disease_name=disease_name,
+                query=q,
+                top_k=RERANK_CANDIDATES,
+                include_embeddings=True
+            )
+
+        original_task = asyncio.ensure_future(retrieve(query))
+
+        try:
+            paraphrases = await asyncio.gather(*(
+                self.paraphrase_query(query, disease_name, style)
+                for style in PARAPHRASE_STYLES[:MULTI_QUERY_PARAPHRASES]
+            ))
+            results = await asyncio.gather(original_task, *(retrieve(p) for p in paraphrases))
+        except Exception:
+            # Paraphrasing is an optimization; fall back to the original query
+            results = [await original_task]
+
+        candidates = {}
+        for chunks in results:
+            for chunk in chunks:
+                candidates.setdefault(chunk["id"], chunk)
+
+        return list(candidates.values())
+
+    async def agentic_query(
         self,
         disease_name: str,
         query: str,
@@ -207,47 +351,80 @@ Return ONLY the refined query, nothing else."""
         """
         if max_attempts is None:
             max_attempts = MAX_VERIFICATION_ATTEMPTS
+        # At least one draft, or the rerank below comes back empty
+        max_attempts = max(max_attempts, 1)
+
+        collection_name = VectorStore._sanitize_name(disease_name)
+        cache_key = (
+            collection_name,
+            self._disease_versions.get(collection_name, 0),
+            re.sub(r"\s+", " ", query.strip().lower()),
+            max_attempts
+        )
+        cached = self._answer_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = await self._run_agentic_query(disease_name, query, max_attempts)
+
+        # A failed verifier call scores confidence 0; caching that would pin
+        # the unverified answer for the whole TTL after a brief outage
+        verifier_failed = any(
+            issue.startswith("Verification error")
+            for attempt in result["attempts"]
+            for issue in attempt.get("issues", [])
+        )
+        if not verifier_failed:
+            self._answer_cache[cache_key] = result
+        return result
 
+    async def _draft_and_verify(
+        self,
+        disease_name: str,
+        query: str,
+        current_query: str,
+        context: List[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Any], VerificationResult]:
+        """Generate an answer from context and verify it against the original query"""
+        rag_result = await asyncio.to_thread(
+            self.rag_engine.answer_from_context,
+            disease_name=disease_name,
+            query=current_query,
+            context=context
+        )
+
+        verification = await self.verify_answer(
+            query=query,  # Always verify against original query
+            answer=rag_result["answer"],
+            context=context,  # Full chunks the answer was generated from
+            disease_name=disease_name
+        )
+
+        return rag_result, verification
+
+    async def _run_agentic_query(
+        self,
+        disease_name: str,
+        query: str,
+        max_attempts: int
+    ) -> Dict[str, Any]:
+        """Run the retrieve-generate-verify-refine loop without caching"""
         attempts = []
-        current_query = query
         best_result = None
         best_confidence = 0.0
 
-        for attempt in range(1, max_attempts + 1):
-            # Get RAG response
-            rag_result = self.rag_engine.query(
-                disease_name=disease_name,
-                query=current_query,
-                top_k=TOP_K_RETRIEVAL + (attempt - 1)  # Increase context on retries
-            )
-
-            if rag_result.get("status") == "no_context":
-                return {
-                    "answer": rag_result["answer"],
-                    "verified": False,
-                    "confidence": 0.0,
-                    "attempts": [{"attempt": 1, "status": "no_context"}],
-                    "references": [],
-                    "disease": disease_name
-                }
+        def record(attempt: int, query_used: str, rag_result: Dict[str, Any], verification: VerificationResult) -> bool:
+            """Record an attempt and return whether it passed verification"""
+            nonlocal best_result, best_confidence
 
-            # Verify the answer
-            verification = self.verify_answer(
-                query=query,  # Always verify against original query
-                answer=rag_result["answer"],
-                context=rag_result.get("retrieved_chunks", []),
-                disease_name=disease_name
-            )
-
-            attempt_record = {
+            attempts.append({
                 "attempt": attempt,
-                "query_used": current_query,
+                "query_used": query_used,
                 "confidence": verification.confidence,
                 "is_verified": verification.is_verified,
                 "issues": verification.issues,
                 "reasoning": verification.reasoning[:500]  # Truncate for response
-            }
-            attempts.append(attempt_record)
+            })
 
             # Track best result
             if verification.confidence > best_confidence:
@@ -259,28 +436,135 @@ Return ONLY the refined query, nothing else."""
                     "verification": verification
                 }
 
-            # Check if verified with high confidence
-            if verification.is_verified and verification.confidence >= CONFIDENCE_THRESHOLD:
-                return {
-                    "answer": rag_result["answer"],
-                    "verified": True,
-                    "confidence": verification.confidence,
-                    "attempts": attempts,
-                    "references": rag_result["references"],
-                    "disease": disease_name,
-                    "verification_reasoning": verification.reasoning,
-                    "final_attempt": attempt
-                }
+            return verification.is_verified and verification.confidence >= CONFIDENCE_THRESHOLD
+
+        def verified_response(attempt: int, rag_result: Dict[str, Any], verification: VerificationResult) -> Dict[str, Any]:
+            return {
+                "answer": rag_result["answer"],
+                "verified": True,
+                "confidence": verification.confidence,
+                "attempts": attempts,
+                "references": rag_result["references"],
+                "disease": disease_name,
+                "verification_reasoning": verification.reasoning,
+                "final_attempt": attempt
+            }
+
+        # Retrieve a wider candidate pool once; retries rerank it for their
+        # refined query instead of searching again with a growing top_k
+        candidates = await self._retrieve_candidates(disease_name, query)
+
+        # Speculative first round: draft answers concurrently from different
+        # subsets of the top candidates and keep the first one that verifies
+        drafts = min(SPECULATIVE_DRAFTS, max_attempts)
+        ranked = await asyncio.to_thread(
+            self.rag_engine.rerank,
+            query=query,
+            candidates=candidates,
+            top_k=TOP_K_RETRIEVAL * drafts
+        )
+
+        if not ranked:
+            no_context = await asyncio.to_thread(
+                self.rag_engine.answer_from_context, disease_name, query, []
+            )
+            return {
+                "answer": no_context["answer"],
+                "verified": False,
+                "confidence": 0.0,
+                "attempts": [{"attempt": 1, "status": "no_context"}],
+                "references": [],
+                "disease": disease_name
+            }
+
+        # Striding gives each draft one of the best chunks plus a spread of the rest
+        draft_tasks = [
+            asyncio.create_task(
+                self._draft_and_verify(disease_name, query, query, ranked[i::drafts])
+            )
+            for i in range(min(drafts, len(ranked)))
+        ]
 
-            # Refine query for next attempt if not last
+        try:
+            for done in asyncio.as_completed(draft_tasks):
+                rag_result, verification = await done
+                previous_answer = rag_result["answer"]
+                attempt = len(attempts) + 1
+                if record(attempt, query, rag_result, verification):
+                    return verified_response(attempt, rag_result, verification)
+        finally:
+            for task in draft_tasks:
+                task.cancel()
+
+        # Sequential refinement from the best draft's verification feedback
+        # for the remaining attempts
+        current_query = query
+        if len(attempts) < max_attempts:
+            current_query = await self.refine_query(
+                original_query=query,
+                previous_answer=best_result["answer"] if best_result else previous_answer,
+                disease_name=disease_name,
+                attempt=len(attempts),
+                verification_result=best_result["verification"] if best_result else None
+            )
+
+        for attempt in range(len(attempts) + 1, max_attempts + 1):
+            context = await asyncio.to_thread(
+                self.rag_engine.rerank,
+                query=current_query,
+                candidates=candidates,
+                top_k=TOP_K_RETRIEVAL
+            )
+
+            rag_result = await asyncio.to_thread(
+                self.rag_engine.answer_from_context,
+                disease_name=disease_name,
+                query=current_query,
+                context=context
+            )
+
+            # Speculatively prepare the next query while this answer is verified
+            refine_task = None
             if attempt < max_attempts:
-                current_query = self.refine_query(
+                refine_task = asyncio.create_task(self.refine_query(
                     original_query=query,
                     previous_answer=rag_result["answer"],
-                    verification_result=verification,
                     disease_name=disease_name,
                     attempt=attempt
-                )
+                ))
+
+            # Verify the answer
+            verification = await self.verify_answer(
+                query=query,  # Always verify against original query
+                answer=rag_result["answer"],
+                context=context,  # Full chunks the answer was generated from
+                disease_name=disease_name
+            )
+
+            # Check if verified with high confidence
+            if record(attempt, current_query, rag_result, verification):
+                if refine_task is not None:
+                    refine_task.cancel()
+                return verified_response(attempt, rag_result, verification)
+
+            # Take the speculative refinement if it is ready; otherwise refine
+            # from the verifier's issues and suggestions instead of waiting
+            if refine_task is not None:
+                try:
+                    if refine_task.done():
+                        current_query = refine_task.result()
+                    else:
+                        refine_task.cancel()
+                        current_query = await self.refine_query(
+                            original_query=query,
+                            previous_answer=rag_result["answer"],
+                            disease_name=disease_name,
+                            attempt=attempt,
+                            verification_result=verification
+                        )
+                except Exception as e:
+                    # Retry with the same query rather than fail the whole answer
+                    logger.warning("Query refinement failed, keeping the previous query: %s", e)
 
         # Return best result after all attempts
         if best_result:
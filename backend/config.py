@@ -15,25 +15,106 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 # Model Configuration
 VISION_MODEL = "gpt-4o"  # For document parsing
 EMBEDDING_MODEL = "text-embedding-3-small"
-REASONING_MODEL = "o1-mini"  # For verification
+EMBEDDING_BATCH_SIZE = 96  # Texts per embeddings request; 96 full chunks stay well under the per-request token cap
+EMBEDDING_CONCURRENCY = 8  # Embeddings requests in flight across all uploads
+EMBEDDING_RETRY_ATTEMPTS = 5  # Tries per embeddings request on rate limits and transient errors
+# "openai" or "fastembed" (local ONNX model, no network round-trip). Vector
+# sizes differ between backends, so re-upload documents after switching.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+FASTEMBED_MODEL = os.getenv("FASTEMBED_MODEL", "BAAI/bge-small-en-v1.5")
+REASONING_MODEL = "gpt-4o-mini"  # For verification (structured JSON output)
 GENERATION_MODEL = "gpt-4o"  # For answer generation
 
+# OpenAI HTTP connection pool
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_TIMEOUT = 60.0  # seconds
+HTTP_CONNECT_TIMEOUT = 10.0  # seconds
+
 # RAG Configuration
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+CHUNK_SIZE = 1024  # tokens
+CHUNK_OVERLAP = 100  # tokens
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", " "]  # Tried in order, coarsest first
 TOP_K_RETRIEVAL = 5
+RERANK_CANDIDATES = 20  # Chunks fetched once per agentic query and reranked on retries
+MULTI_QUERY_PARAPHRASES = 2  # Paraphrases searched alongside the query on attempt 1 (max 2)
+SPECULATIVE_DRAFTS = 3  # Answers drafted and verified concurrently before sequential refinement
 MAX_VERIFICATION_ATTEMPTS = 5
 CONFIDENCE_THRESHOLD = 0.8
+# Max context tokens sent to the verifier: room for every generation chunk
+# plus its [Source N] label, so cited sources are never cut off
+VERIFIER_CONTEXT_TOKEN_BUDGET = TOP_K_RETRIEVAL * (CHUNK_SIZE + 32)
+
+# Answer cache for repeated (disease, query) pairs
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_TTL = 3600  # seconds
+
+# Response caches for unverified RAG queries: exact normalized query first,
+# then semantic match by query embedding
+EXACT_CACHE_SIZE = 2048
+SEMANTIC_CACHE_SIZE = 10000
+SEMANTIC_CACHE_THRESHOLD = 0.97  # Min cosine similarity to reuse a response
+QUERY_EMBEDDING_CACHE_SIZE = 4096  # In-memory query embeddings
+
+# Optional Chroma server (e.g. a sidecar container). When set, the vector
+# store is served over HTTP instead of opened in-process from VECTOR_DB_DIR,
+# so writes don't serialize on the local SQLite file
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
+# HNSW index parameters, fixed when a disease collection is created
+HNSW_M = 24  # Graph links per node
+HNSW_EF_CONSTRUCTION = 128  # Candidate list size while building
+# Candidate list size while searching: at least 4x the largest top_k any
+# search requests (the rerank pool), and never below 100
+HNSW_EF_SEARCH = max(100, RERANK_CANDIDATES * 4)
+HNSW_BATCH_SIZE = 10000  # Vectors buffered before they are added to the index
+HNSW_SYNC_THRESHOLD = 100000  # Vectors added before the index is persisted
+
+# Document Processing Configuration
+VISION_CONCURRENCY = 8  # Max concurrent Vision API calls per PDF
+VISION_MAX_IMAGE_EDGE = 2048  # Images are downscaled to this long edge (px)
+VISION_JPEG_QUALITY = 85
+PDF_MIN_TEXT_CHARS = 200  # Pages with less embedded text are OCR'd
+PDF_MIN_TEXT_COVERAGE = 0.3  # Fraction of page area covered by text blocks
+PDF_MAX_IMAGE_COVERAGE = 0.5  # Fraction of page area covered by images
+
+# Bulk ingestion: documents with more chunks than this are embedded through
+# the OpenAI Batch API (50% cheaper, completes within 24h) in the background
+USE_BATCH_EMBEDDINGS = os.getenv("USE_BATCH_EMBEDDINGS", "true").lower() == "true"
+BATCH_EMBEDDING_MIN_CHUNKS = 64
+BATCH_EMBEDDING_POLL_INTERVAL = 60  # seconds
+BATCH_JOBS_DIR = DATA_DIR / "batch_jobs"  # Pending jobs, resumed at startup
+
+# Ingestion queue: other uploads are acknowledged with 202 and indexed by
+# background workers that share embeddings requests across documents
+INGEST_WORKERS = 2
+INGEST_QUEUE_SIZE = 256  # Documents waiting to be indexed before uploads wait
+INGEST_BATCH_TEXTS = 256  # Chunks gathered across documents per embedding round
+INGEST_BATCH_WINDOW = 0.1  # seconds to wait for more documents before embedding
 
 # Vector DB Configuration
 VECTOR_DB_DIR = DATA_DIR / "vectordb"
 
+# Content-addressed caches (keyed by hash of image bytes / chunk text)
+OCR_CACHE_DIR = DATA_DIR / "ocr_cache"
+EMBEDDING_CACHE_DIR = DATA_DIR / "embedding_cache"
+EMBEDDING_CACHE_SIZE_LIMIT = 4 * 1024 ** 3  # bytes; oldest embeddings are evicted beyond this
+LISTING_CACHE_TTL = 5  # seconds; disease and document listings
+LIST_DISEASES_WORKERS = 8  # Threads counting collections for list_diseases
+
 # Supported file types
-SUPPORTED_EXTENSIONS = {".pdf", ".json", ".png", ".jpg", ".jpeg", ".gif", ".md", ".txt"}
+SUPPORTED_EXTENSIONS = frozenset({".pdf", ".json", ".png", ".jpg", ".jpeg", ".gif", ".md", ".txt"})
 
 # Server Configuration
 HOST = "0.0.0.0"
 PORT = 8000
+# Each worker keeps its own answer caches (exact, semantic and verifier) and
+# document index, and only the worker that indexed an upload invalidates
+# them, so other workers serve stale answers and listings after uploads.
+# Keep this at 1 unless that staleness is acceptable
+WORKERS = int(os.getenv("WORKERS", "1"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
 # API Authentication (for n8n and external integrations)
 API_KEY = os.getenv("RAG_API_KEY", "")  # Set this for API authentication
@@ -42,3 +123,8 @@ REQUIRE_API_KEY = os.getenv("REQUIRE_API_KEY", "false").lower() == "true"
 
 # Webhook Configuration (for async callbacks)
 WEBHOOK_TIMEOUT = 30  # seconds
+
+# Shared outbound HTTP client (webhooks, URL uploads)
+OUTBOUND_MAX_CONNECTIONS = 100
+OUTBOUND_MAX_KEEPALIVE_CONNECTIONS = 20
+URL_FETCH_TIMEOUT = 60  # seconds
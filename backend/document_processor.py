@@ -4,29 +4,46 @@ Handles PDF, JSON, Images, and Markdown files
 """
 import base64
 import json
+import asyncio
+import hashlib
 import io
+import logging
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import fitz  # PyMuPDF for PDF processing
+import tiktoken
+import diskcache
 from PIL import Image
-from openai import OpenAI
 
 from config import (
-    OPENAI_API_KEY,
     VISION_MODEL,
+    EMBEDDING_MODEL,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
-    SUPPORTED_EXTENSIONS
+    CHUNK_SEPARATORS,
+    SUPPORTED_EXTENSIONS,
+    VISION_CONCURRENCY,
+    VISION_MAX_IMAGE_EDGE,
+    VISION_JPEG_QUALITY,
+    PDF_MIN_TEXT_CHARS,
+    PDF_MIN_TEXT_COVERAGE,
+    PDF_MAX_IMAGE_COVERAGE,
+    OCR_CACHE_DIR
 )
+from openai_clients import get_async_openai_client
+
+logger = logging.getLogger("ragapi.documents")
 
 
 class DocumentProcessor:
     """Process various document types into text chunks for RAG"""
 
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = get_async_openai_client()
+        self.encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        self.ocr_cache = diskcache.Cache(str(OCR_CACHE_DIR))
 
-    def process_document(self, file_path: Path, file_content: bytes = None) -> Dict[str, Any]:
+    async def process_document(self, file_path: Path, file_content: bytes = None) -> Dict[str, Any]:
         """
         Process a document and return extracted text with metadata
 
@@ -42,20 +59,21 @@ class DocumentProcessor:
         if extension not in SUPPORTED_EXTENSIONS:
             raise ValueError(f"Unsupported file type: {extension}")
 
-        # Extract text based on file type
+        # Extract text based on file type; file reads and parsing run off
+        # the event loop
         if extension == ".pdf":
-            text = self._process_pdf(file_path, file_content)
+            text = await self._process_pdf(file_path, file_content)
         elif extension == ".json":
-            text = self._process_json(file_path, file_content)
+            text = await asyncio.to_thread(self._process_json, file_path, file_content)
         elif extension in {".png", ".jpg", ".jpeg", ".gif"}:
-            text = self._process_image(file_path, file_content)
+            text = await self._process_image(file_path, file_content)
         elif extension in {".md", ".txt"}:
-            text = self._process_text(file_path, file_content)
+            text = await asyncio.to_thread(self._process_text, file_path, file_content)
         else:
             raise ValueError(f"Unsupported file type: {extension}")
 
-        # Create chunks
-        chunks = self._create_chunks(text)
+        # Create chunks (tokenizes the whole document) off the event loop
+        chunks = await asyncio.to_thread(self._create_chunks, text)
 
         return {
             "text": text,
@@ -67,9 +85,41 @@ class DocumentProcessor:
             }
         }
 
-    def _process_pdf(self, file_path: Path, file_content: bytes = None) -> str:
+    async def _process_pdf(self, file_path: Path, file_content: bytes = None) -> str:
         """Process PDF using PyMuPDF and OpenAI Vision for images"""
+        # Parsing and rendering pages is CPU-bound; keep it off the event loop
+        all_text, vision_pages = await asyncio.to_thread(self._read_pdf_pages, file_path, file_content)
+
+        # Run Vision API calls concurrently, bounded to respect rate limits
+        semaphore = asyncio.Semaphore(VISION_CONCURRENCY)
+
+        async def extract(img_bytes: bytes) -> str:
+            async with semaphore:
+                return await self._extract_text_from_image(img_bytes)
+
+        vision_texts = await asyncio.gather(
+            *(extract(img_bytes) for _, img_bytes in vision_pages)
+        )
+
+        for (page_num, _), vision_text in zip(vision_pages, vision_texts):
+            if vision_text:
+                all_text[page_num] = f"[Page {page_num + 1}]\n{vision_text}"
+
+        return "\n\n".join(all_text)
+
+    def _read_pdf_pages(
+        self,
+        file_path: Path,
+        file_content: bytes = None
+    ) -> Tuple[List[str], List[Tuple[int, bytes]]]:
+        """
+        Extract each page's embedded text and render pages that need Vision OCR
+
+        Returns:
+            Tuple of (text per page, (page number, rendered PNG) per Vision page)
+        """
         all_text = []
+        vision_pages = []  # (page number, rendered page image)
 
         if file_content:
             pdf_document = fitz.open(stream=file_content, filetype="pdf")
@@ -80,26 +130,50 @@ class DocumentProcessor:
             page = pdf_document[page_num]
 
             # Extract text directly
-            text = page.get_text()
-
-            # If page has images or text extraction is poor, use Vision API
-            images = page.get_images()
+            text, needs_vision = self._extract_native_text(page)
 
-            if images or len(text.strip()) < 50:
-                # Render page as image and use Vision API
+            if needs_vision:
+                # Render page as image for the Vision API pass
                 pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for clarity
-                img_bytes = pix.tobytes("png")
+                vision_pages.append((page_num, pix.tobytes("png")))
 
-                vision_text = self._extract_text_from_image(img_bytes)
-                if vision_text:
-                    text = f"[Page {page_num + 1}]\n{vision_text}"
-            else:
-                text = f"[Page {page_num + 1}]\n{text}"
-
-            all_text.append(text)
+            all_text.append(f"[Page {page_num + 1}]\n{text}")
 
         pdf_document.close()
-        return "\n\n".join(all_text)
+
+        return all_text, vision_pages
+
+    def _extract_native_text(self, page: fitz.Page) -> Tuple[str, bool]:
+        """
+        Extract a page's embedded text and decide whether it needs Vision OCR
+
+        Vision is used when the page has little extractable text, or when
+        images cover most of the page and text covers little of it (scans,
+        figures). Decorative images next to real text do not trigger it.
+
+        Returns:
+            Tuple of (extracted text, whether to fall back to Vision API)
+        """
+        page_area = abs(page.rect) or 1.0
+
+        # Text blocks are (x0, y0, x1, y1, text, block_no, block_type)
+        text_blocks = [b for b in page.get_text("blocks") if b[6] == 0]
+        text = "".join(b[4] for b in text_blocks)
+        text_area = sum(abs(fitz.Rect(b[:4])) for b in text_blocks)
+
+        image_area = sum(
+            abs(fitz.Rect(info["bbox"]) & page.rect)
+            for info in page.get_image_info()
+        )
+
+        text_coverage = text_area / page_area
+        image_coverage = min(image_area / page_area, 1.0)
+
+        needs_vision = len(text.strip()) < PDF_MIN_TEXT_CHARS or (
+            image_coverage > PDF_MAX_IMAGE_COVERAGE and text_coverage < PDF_MIN_TEXT_COVERAGE
+        )
+
+        return text, needs_vision
 
     def _process_json(self, file_path: Path, file_content: bytes = None) -> str:
         """Process JSON file into readable text"""
@@ -113,38 +187,46 @@ class DocumentProcessor:
         text = self._json_to_text(data)
         return text
 
-    def _json_to_text(self, data: Any, prefix: str = "") -> str:
-        """Recursively convert JSON to readable text"""
-        lines = []
+    def _json_to_text(self, data: Any) -> str:
+        """Convert JSON to readable indented text"""
+        if not isinstance(data, (dict, list)):
+            return f"{data}"
 
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if isinstance(value, (dict, list)):
-                    lines.append(f"{prefix}{key}:")
-                    lines.append(self._json_to_text(value, prefix + "  "))
-                else:
-                    lines.append(f"{prefix}{key}: {value}")
-        elif isinstance(data, list):
-            for i, item in enumerate(data):
-                if isinstance(item, (dict, list)):
-                    lines.append(f"{prefix}Item {i + 1}:")
-                    lines.append(self._json_to_text(item, prefix + "  "))
+        def entries(node):
+            return iter(node.items()) if isinstance(node, dict) else enumerate(node)
+
+        lines: List[str] = []
+
+        # Explicit stack of (entry iterator, is_dict, indent) instead of recursion
+        stack = [(entries(data), isinstance(data, dict), "")]
+
+        while stack:
+            items, is_dict, prefix = stack[-1]
+            entry = next(items, None)
+            if entry is None:
+                stack.pop()
+                continue
+
+            key, value = entry
+            if isinstance(value, (dict, list)):
+                lines.append(f"{prefix}{key}:" if is_dict else f"{prefix}Item {key + 1}:")
+                if value:
+                    stack.append((entries(value), isinstance(value, dict), prefix + "  "))
                 else:
-                    lines.append(f"{prefix}- {item}")
-        else:
-            lines.append(f"{prefix}{data}")
+                    lines.append("")
+            else:
+                lines.append(f"{prefix}{key}: {value}" if is_dict else f"{prefix}- {value}")
 
         return "\n".join(lines)
 
-    def _process_image(self, file_path: Path, file_content: bytes = None) -> str:
+    async def _process_image(self, file_path: Path, file_content: bytes = None) -> str:
         """Process image using OpenAI Vision API"""
         if file_content:
             img_bytes = file_content
         else:
-            with open(file_path, 'rb') as f:
-                img_bytes = f.read()
+            img_bytes = await asyncio.to_thread(file_path.read_bytes)
 
-        return self._extract_text_from_image(img_bytes)
+        return await self._extract_text_from_image(img_bytes)
 
     def _process_text(self, file_path: Path, file_content: bytes = None) -> str:
         """Process text/markdown files"""
@@ -154,12 +236,49 @@ class DocumentProcessor:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return f.read()
 
-    def _extract_text_from_image(self, image_bytes: bytes) -> str:
+    def _prepare_image(self, image_bytes: bytes) -> bytes:
+        """
+        Downscale and JPEG-encode an image for the Vision API
+
+        Vision tokens scale with image tiles, and pixels beyond
+        VISION_MAX_IMAGE_EDGE do not improve OCR of document text.
+        """
+        image = Image.open(io.BytesIO(image_bytes))
+        image.thumbnail((VISION_MAX_IMAGE_EDGE, VISION_MAX_IMAGE_EDGE), Image.LANCZOS)
+
+        if image.mode in {"RGBA", "LA", "PA"} or (image.mode == "P" and "transparency" in image.info):
+            # JPEG has no alpha; flatten onto white so dark text on a
+            # transparent background stays readable instead of turning black
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+    async def _extract_text_from_image(self, image_bytes: bytes) -> str:
         """Use OpenAI Vision API to extract text from image"""
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        # Identical images (re-uploads, repeated pages) reuse the cached OCR
+        hasher = hashlib.blake2b(image_bytes, digest_size=16)
+        hasher.update(VISION_MODEL.encode())
+        cache_key = hasher.hexdigest()
+
+        cached = self.ocr_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         try:
-            response = self.client.chat.completions.create(
+            jpeg_bytes = await asyncio.to_thread(self._prepare_image, image_bytes)
+            # Build the data URL as bytes and decode it to str once
+            image_url = (
+                b"data:image/jpeg;base64," + base64.b64encode(memoryview(jpeg_bytes))
+            ).decode('ascii')
+
+            response = await self.client.chat.completions.create(
                 model=VISION_MODEL,
                 messages=[
                     {
@@ -184,8 +303,8 @@ Instructions:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}",
-                                    "detail": "high"
+                                    "url": image_url,
+                                    "detail": "auto"
                                 }
                             }
                         ]
@@ -193,49 +312,127 @@ Instructions:
                 ],
                 max_tokens=4096
             )
-            return response.choices[0].message.content
+            text = response.choices[0].message.content
+            self.ocr_cache.set(cache_key, text)
+            return text
         except Exception as e:
-            print(f"Vision API error: {e}")
+            logger.warning("Vision API error: %s", e)
             return ""
 
     def _create_chunks(self, text: str) -> List[Dict[str, Any]]:
-        """Split text into overlapping chunks with metadata"""
+        """Split text into overlapping chunks sized in embedding-model tokens"""
         chunks = []
 
-        # Split by paragraphs first to maintain context
-        paragraphs = text.split('\n\n')
-        current_chunk = ""
-        chunk_id = 0
-
-        for para in paragraphs:
-            # If adding this paragraph exceeds chunk size
-            if len(current_chunk) + len(para) > CHUNK_SIZE:
-                if current_chunk:
-                    chunks.append({
-                        "id": chunk_id,
-                        "text": current_chunk.strip(),
-                        "char_count": len(current_chunk.strip())
-                    })
-                    chunk_id += 1
-
-                    # Keep overlap from end of current chunk
-                    overlap_start = max(0, len(current_chunk) - CHUNK_OVERLAP)
-                    current_chunk = current_chunk[overlap_start:] + "\n\n" + para
-                else:
-                    current_chunk = para
-            else:
-                current_chunk += "\n\n" + para if current_chunk else para
-
-        # Add final chunk
-        if current_chunk.strip():
-            chunks.append({
-                "id": chunk_id,
-                "text": current_chunk.strip(),
-                "char_count": len(current_chunk.strip())
-            })
+        for chunk_text, token_count in self._split_text(text, CHUNK_SEPARATORS):
+            chunk_text = chunk_text.strip()
+            if chunk_text:
+                chunks.append({
+                    "id": len(chunks),
+                    "text": chunk_text,
+                    "char_count": len(chunk_text),
+                    "token_count": token_count
+                })
 
         return chunks
 
+    def _split_text(self, text: str, separators: List[str]) -> List[Tuple[str, int]]:
+        """
+        Recursively split text on progressively finer separators
+
+        Pieces that fit in CHUNK_SIZE are merged back together with the
+        separator they were split on; oversized pieces are split again with
+        the next separator, and as a last resort by raw token windows.
+
+        Returns:
+            List of (text, token_count) pieces
+        """
+        # Use the coarsest separator present in the text
+        separator, remaining = "", []
+        for i, sep in enumerate(separators):
+            if sep in text:
+                separator, remaining = sep, separators[i + 1:]
+                break
+
+        splits = text.split(separator) if separator else [text]
+        split_tokens = [len(t) for t in self.encoding.encode_ordinary_batch(splits)]
+        sep_tokens = len(self.encoding.encode_ordinary(separator))
+
+        results = []
+        fitting = []
+        for split, n_tokens in zip(splits, split_tokens):
+            if n_tokens <= CHUNK_SIZE:
+                fitting.append((split, n_tokens))
+                continue
+
+            if fitting:
+                results.extend(self._merge_splits(fitting, separator, sep_tokens))
+                fitting = []
+
+            if remaining:
+                results.extend(self._split_text(split, remaining))
+            else:
+                results.extend(self._split_tokens(split))
+
+        if fitting:
+            results.extend(self._merge_splits(fitting, separator, sep_tokens))
+
+        return results
+
+    def _merge_splits(
+        self,
+        splits: List[Tuple[str, int]],
+        separator: str,
+        sep_tokens: int
+    ) -> List[Tuple[str, int]]:
+        """Merge small splits into chunks of up to CHUNK_SIZE tokens with overlap"""
+        merged = []
+
+        # Splits of the current chunk; joined only when the chunk is emitted.
+        # buf_len counts each split's tokens plus its separator.
+        buf: List[Tuple[str, int]] = []
+        buf_len = 0
+
+        for split, n_tokens in splits:
+            # If adding this split exceeds chunk size
+            if buf and buf_len + n_tokens > CHUNK_SIZE:
+                merged.append((separator.join(s for s, _ in buf), buf_len - sep_tokens))
+
+                # Keep trailing splits that fit in the overlap window
+                overlap_start = len(buf)
+                overlap_len = 0
+                while overlap_start > 0 and overlap_len + buf[overlap_start - 1][1] + sep_tokens <= CHUNK_OVERLAP:
+                    overlap_start -= 1
+                    overlap_len += buf[overlap_start][1] + sep_tokens
+
+                # Drop leading overlap if the next split wouldn't fit with it
+                while overlap_start < len(buf) and overlap_len + n_tokens > CHUNK_SIZE:
+                    overlap_len -= buf[overlap_start][1] + sep_tokens
+                    overlap_start += 1
+
+                buf = buf[overlap_start:]
+                buf_len = overlap_len
+
+            buf.append((split, n_tokens))
+            buf_len += n_tokens + sep_tokens
+
+        if buf:
+            merged.append((separator.join(s for s, _ in buf), buf_len - sep_tokens))
+
+        return merged
+
+    def _split_tokens(self, text: str) -> List[Tuple[str, int]]:
+        """Split text with no usable separator into overlapping token windows"""
+        tokens = self.encoding.encode_ordinary(text)
+        if not tokens:
+            return []
+        step = CHUNK_SIZE - CHUNK_OVERLAP
+
+        # Stop before a final window that would lie inside the previous one's overlap
+        return [
+            (self.encoding.decode(tokens[i:i + CHUNK_SIZE]), len(tokens[i:i + CHUNK_SIZE]))
+            for i in range(0, max(len(tokens) - CHUNK_OVERLAP, 1), step)
+        ]
+
 
 # Singleton instance
 _processor = None
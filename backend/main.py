@@ -5,64 +5,103 @@ Enhanced for n8n and external integrations
 """
 import os
 import uuid
+import fcntl
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
 import shutil
 import httpx
+import openai
+import orjson
+import msgspec
 import asyncio
 from pathlib import Path
-from typing import List, Optional
+from typing import Annotated, Dict, List, Optional, Type, TypeVar
 from contextlib import asynccontextmanager
 from functools import wraps
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Header, Depends, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 
 from config import (
-    HOST, PORT, DATA_DIR, UPLOAD_DIR,
+    HOST, PORT, WORKERS, LOG_LEVEL, DATA_DIR, UPLOAD_DIR,
     SUPPORTED_EXTENSIONS, MAX_VERIFICATION_ATTEMPTS,
-    API_KEY, API_KEY_HEADER, REQUIRE_API_KEY, WEBHOOK_TIMEOUT
+    API_KEY, API_KEY_HEADER, REQUIRE_API_KEY, WEBHOOK_TIMEOUT,
+    OUTBOUND_MAX_CONNECTIONS, OUTBOUND_MAX_KEEPALIVE_CONNECTIONS, URL_FETCH_TIMEOUT,
+    EMBEDDING_BACKEND, USE_BATCH_EMBEDDINGS, BATCH_EMBEDDING_MIN_CHUNKS, BATCH_EMBEDDING_POLL_INTERVAL, BATCH_JOBS_DIR,
+    INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_BATCH_TEXTS, INGEST_BATCH_WINDOW
 )
 from document_processor import get_processor
 from vector_store import get_vector_store
 from rag_engine import get_rag_engine
 from agentic_verifier import get_agentic_verifier
 
+T = TypeVar("T")
 
-# ==================== Pydantic Models ====================
+logger = logging.getLogger("ragapi")
 
-class QueryRequest(BaseModel):
-    disease: str = Field(..., description="Disease collection to query")
-    query: str = Field(..., description="Question to ask")
-    use_verification: bool = Field(True, description="Enable agentic verification")
-    max_attempts: int = Field(MAX_VERIFICATION_ATTEMPTS, description="Max verification attempts")
-    webhook_url: Optional[str] = Field(None, description="Webhook URL for async callback")
 
+# ==================== Request Models ====================
+# Request bodies are msgspec Structs, decoded from the raw body in each
+# endpoint; response schemas below stay Pydantic for OpenAPI only
 
-class QueryResponse(BaseModel):
-    success: bool = True
-    answer: str
-    verified: bool
-    confidence: float
-    references: List[dict]
-    disease: str
-    attempts: Optional[List[dict]] = None
-    warning: Optional[str] = None
+class QueryRequest(msgspec.Struct):
+    disease: Annotated[str, msgspec.Meta(description="Disease collection to query")]
+    query: Annotated[str, msgspec.Meta(description="Question to ask")]
+    use_verification: Annotated[bool, msgspec.Meta(description="Enable agentic verification")] = True
+    max_attempts: Annotated[int, msgspec.Meta(ge=1, description="Max verification attempts")] = MAX_VERIFICATION_ATTEMPTS
+    webhook_url: Annotated[Optional[str], msgspec.Meta(description="Webhook URL for async callback")] = None
 
 
-class N8nQueryRequest(BaseModel):
+class N8nQueryRequest(msgspec.Struct):
     """Simplified request format for n8n"""
     disease: str
     question: str
     verify: bool = True
 
 
-class DiseaseCreate(BaseModel):
+class DiseaseCreate(msgspec.Struct):
     name: str
 
 
+async def decode_request(http_request: Request, struct_type: Type[T]) -> T:
+    """Decode and validate a JSON request body into a msgspec Struct"""
+    try:
+        return msgspec.json.decode(await http_request.body(), type=struct_type, strict=False)
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except msgspec.DecodeError:
+        raise HTTPException(status_code=400, detail="Request body must be valid JSON")
+
+
+def request_body_schema(struct_type: type) -> dict:
+    """OpenAPI request body for endpoints that decode their JSON body manually"""
+    _, components = msgspec.json.schema_components([struct_type])
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": components[struct_type.__name__]}}
+        }
+    }
+
+
+# ==================== Response Models ====================
+
+class QueryResponse(BaseModel):
+    success: bool = True
+    answer: str
+    verified: bool
+    confidence: float
+    references: List[dict]
+    disease: str
+    attempts: Optional[List[dict]] = None
+    warning: Optional[str] = None
+
+
 class DiseaseResponse(BaseModel):
     name: str
     display_name: str
@@ -75,6 +114,8 @@ class DocumentResponse(BaseModel):
     filename: str
     disease: str
     chunks_added: int
+    chunks_pending: int
+    status: str
 
 
 class HealthResponse(BaseModel):
@@ -89,6 +130,38 @@ class ErrorResponse(BaseModel):
     detail: Optional[str] = None
 
 
+# ==================== Responses ====================
+
+class SourceList:
+    """References to render as n8n sources while the response is serialized"""
+    __slots__ = ("refs",)
+
+    def __init__(self, refs: List[dict]):
+        self.refs = refs
+
+
+def _json_default(obj):
+    if isinstance(obj, SourceList):
+        return [{"file": ref["filename"], "excerpt": ref["excerpt_200"]} for ref in obj.refs]
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def public_references(refs: List[dict]) -> List[dict]:
+    """References without the excerpt_200 prefix kept for n8n sources"""
+    return [{k: v for k, v in ref.items() if k != "excerpt_200"} for ref in refs]
+
+
+class SourcesJSONResponse(ORJSONResponse):
+    """ORJSONResponse that expands SourceList values during serialization"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+
 # ==================== API Key Authentication ====================
 
 api_key_header = APIKeyHeader(name=API_KEY_HEADER, auto_error=False)
@@ -112,21 +185,113 @@ async def verify_api_key(api_key: Optional[str] = Depends(api_key_header)):
     return True
 
 
+# ==================== Cache Invalidation ====================
+
+def invalidate_caches(disease_name: str):
+    """Drop cached answers for a disease after its documents change"""
+    _engine.invalidate_disease(disease_name)
+    _verifier.invalidate_disease(disease_name)
+
+
 # ==================== Startup/Shutdown ====================
 
+def start_logging() -> QueueListener:
+    """
+    Route ragapi logs through a queue drained by a listener thread, so
+    request handlers never block on a slow stdout
+    """
+    log_queue = queue.SimpleQueue()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+# Bound once at startup so request handlers skip the lazy getters
+_processor = None
+_store = None
+_engine = None
+_verifier = None
+_ingest_queue = None
+
+# Running batch embedding jobs, cancelled at shutdown and resumed from
+# their saved JSON on the next startup
+_batch_tasks = set()
+
+
+def start_batch_task(coro):
+    """Run a batch embedding job as a task that shutdown can cancel"""
+    task = asyncio.create_task(coro)
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    return task
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global _processor, _store, _engine, _verifier, _ingest_queue
+
     # Startup
+    log_listener = start_logging()
+
+    _processor = get_processor()
+    _store = get_vector_store()
+    _engine = get_rag_engine()
+    _verifier = get_agentic_verifier()
+
+    # Run coroutines eagerly until their first real suspension (Python 3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    print(f"Agentic RAG API starting...")
-    print(f"Data directory: {DATA_DIR}")
-    print(f"API Key Required: {REQUIRE_API_KEY}")
+    logger.info("Agentic RAG API starting...")
+    logger.info("Data directory: %s", DATA_DIR)
+    logger.info("API Key Required: %s", REQUIRE_API_KEY)
+
+    # One keepalive pool for webhooks and URL uploads
+    app.state.http = httpx.AsyncClient(
+        timeout=WEBHOOK_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=OUTBOUND_MAX_CONNECTIONS,
+            max_keepalive_connections=OUTBOUND_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+
+    _ingest_queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    ingest_workers = [
+        asyncio.create_task(ingestion_worker(_ingest_queue))
+        for _ in range(INGEST_WORKERS)
+    ]
+
+    # Resume polling batch jobs submitted before the last restart; each job
+    # is locked so only one worker polls it
+    BATCH_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    batch_jobs = await asyncio.to_thread(claim_batch_jobs)
+    for job in batch_jobs:
+        start_batch_task(finish_batch_job(job))
+    if batch_jobs:
+        logger.info("Resuming %d embedding batch jobs", len(batch_jobs))
 
     yield
 
-    # Shutdown
-    print("Agentic RAG API shutting down...")
+    # Shutdown: index documents already accepted before stopping the workers
+    await _ingest_queue.join()
+    # Batch jobs stay saved and resume on the next startup
+    batch_tasks = list(_batch_tasks)
+    for task in ingest_workers + batch_tasks:
+        task.cancel()
+    await asyncio.gather(*ingest_workers, *batch_tasks, return_exceptions=True)
+    await app.state.http.aclose()
+    logger.info("Agentic RAG API shutting down...")
+    log_listener.stop()
 
 
 # ==================== Create FastAPI App ====================
@@ -149,7 +314,8 @@ Set `X-API-Key` header when `REQUIRE_API_KEY=true`
 Use the `/api/v1/*` endpoints for easy n8n integration
     """,
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -182,14 +348,14 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 # ==================== Health Check ====================
 
-@app.get("/health", response_model=HealthResponse, tags=["System"])
+@app.get("/health", responses={200: {"model": HealthResponse}}, tags=["System"])
 async def health_check():
     """Health check endpoint - no authentication required"""
-    return {
+    return ORJSONResponse(content={
         "status": "healthy",
         "version": "1.0.0",
         "api_key_required": REQUIRE_API_KEY
-    }
+    })
 
 
 # ==================== n8n Simple API (v1) ====================
@@ -215,34 +381,29 @@ async def n8n_ask_get(
     5. Headers: `X-API-Key: your-api-key` (if required)
     """
     if verify:
-        verifier = get_agentic_verifier()
-        result = verifier.agentic_query(
+        result = await _verifier.agentic_query(
             disease_name=disease,
             query=question,
             max_attempts=MAX_VERIFICATION_ATTEMPTS
         )
     else:
-        engine = get_rag_engine()
-        result = engine.query(disease_name=disease, query=question)
+        result = await asyncio.to_thread(_engine.query, disease_name=disease, query=question)
         result["verified"] = False
         result["confidence"] = 0.0
 
-    return {
+    return SourcesJSONResponse(content={
         "success": True,
         "answer": result.get("answer", ""),
         "verified": result.get("verified", False),
         "confidence": result.get("confidence", 0.0),
-        "sources": [
-            {"file": ref.get("filename"), "excerpt": ref.get("excerpt", "")[:200]}
-            for ref in result.get("references", [])
-        ],
+        "sources": SourceList(result.get("references", [])),
         "disease": disease
-    }
+    })
 
 
-@app.post("/api/v1/ask", tags=["n8n Integration"])
+@app.post("/api/v1/ask", tags=["n8n Integration"], openapi_extra=request_body_schema(N8nQueryRequest))
 async def n8n_ask_post(
-    request: N8nQueryRequest,
+    http_request: Request,
     _: bool = Depends(verify_api_key)
 ):
     """
@@ -256,30 +417,29 @@ async def n8n_ask_post(
     5. Body: `{"disease": "diabetes", "question": "What are symptoms?"}`
     6. Headers: `X-API-Key: your-api-key` (if required)
     """
+    request = await decode_request(http_request, N8nQueryRequest)
+
     if request.verify:
-        verifier = get_agentic_verifier()
-        result = verifier.agentic_query(
+        result = await _verifier.agentic_query(
             disease_name=request.disease,
             query=request.question,
             max_attempts=MAX_VERIFICATION_ATTEMPTS
         )
     else:
-        engine = get_rag_engine()
-        result = engine.query(disease_name=request.disease, query=request.question)
+        result = await asyncio.to_thread(
+            _engine.query, disease_name=request.disease, query=request.question
+        )
         result["verified"] = False
         result["confidence"] = 0.0
 
-    return {
+    return SourcesJSONResponse(content={
         "success": True,
         "answer": result.get("answer", ""),
         "verified": result.get("verified", False),
         "confidence": result.get("confidence", 0.0),
-        "sources": [
-            {"file": ref.get("filename"), "excerpt": ref.get("excerpt", "")[:200]}
-            for ref in result.get("references", [])
-        ],
+        "sources": SourceList(result.get("references", [])),
         "disease": request.disease
-    }
+    })
 
 
 @app.get("/api/v1/diseases", tags=["n8n Integration"])
@@ -289,13 +449,12 @@ async def n8n_list_diseases(_: bool = Depends(verify_api_key)):
 
     Returns simple array of disease names for dropdowns
     """
-    store = get_vector_store()
-    diseases = store.list_diseases()
-    return {
+    diseases = await asyncio.to_thread(_store.list_diseases)
+    return ORJSONResponse(content={
         "success": True,
         "diseases": [d["display_name"] for d in diseases],
         "details": diseases
-    }
+    })
 
 
 @app.post("/api/v1/diseases", tags=["n8n Integration"])
@@ -304,8 +463,7 @@ async def n8n_create_disease(
     _: bool = Depends(verify_api_key)
 ):
     """Create a new disease collection via query parameter"""
-    store = get_vector_store()
-    result = store.create_disease(name)
+    result = _store.create_disease(name)
     return {"success": True, **result}
 
 
@@ -314,15 +472,14 @@ async def n8n_create_disease(
 async def send_webhook(webhook_url: str, data: dict):
     """Send result to webhook URL"""
     try:
-        async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
-            await client.post(webhook_url, json=data)
+        await app.state.http.post(webhook_url, json=data)
     except Exception as e:
-        print(f"Webhook delivery failed: {e}")
+        logger.warning("Webhook delivery failed: %s", e)
 
 
-@app.post("/api/v1/ask/async", tags=["n8n Integration"])
+@app.post("/api/v1/ask/async", tags=["n8n Integration"], openapi_extra=request_body_schema(QueryRequest))
 async def n8n_ask_async(
-    request: QueryRequest,
+    http_request: Request,
     background_tasks: BackgroundTasks,
     _: bool = Depends(verify_api_key)
 ):
@@ -338,6 +495,8 @@ async def n8n_ask_async(
        - POST to `/api/v1/ask/async`
        - Body: `{"disease": "...", "query": "...", "webhook_url": "{{$node.Webhook.webhookUrl}}"}`
     """
+    request = await decode_request(http_request, QueryRequest)
+
     if not request.webhook_url:
         raise HTTPException(400, "webhook_url is required for async requests")
 
@@ -347,22 +506,23 @@ async def n8n_ask_async(
     async def process_and_callback():
         try:
             if request.use_verification:
-                verifier = get_agentic_verifier()
-                result = verifier.agentic_query(
+                result = await _verifier.agentic_query(
                     disease_name=request.disease,
                     query=request.query,
                     max_attempts=request.max_attempts
                 )
             else:
-                engine = get_rag_engine()
-                result = engine.query(disease_name=request.disease, query=request.query)
+                result = await asyncio.to_thread(
+                    _engine.query, disease_name=request.disease, query=request.query
+                )
                 result["verified"] = False
                 result["confidence"] = 0.0
 
             await send_webhook(request.webhook_url, {
                 "request_id": request_id,
                 "success": True,
-                **result
+                **result,
+                "references": public_references(result["references"])
             })
         except Exception as e:
             await send_webhook(request.webhook_url, {
@@ -383,30 +543,32 @@ async def n8n_ask_async(
 
 # ==================== Standard API Endpoints ====================
 
-@app.get("/diseases", response_model=List[DiseaseResponse], tags=["Diseases"])
+@app.get("/diseases", responses={200: {"model": List[DiseaseResponse]}}, tags=["Diseases"])
 async def list_diseases(_: bool = Depends(verify_api_key)):
     """List all disease collections"""
-    store = get_vector_store()
-    return store.list_diseases()
+    return ORJSONResponse(content=await asyncio.to_thread(_store.list_diseases))
 
 
-@app.post("/diseases", response_model=DiseaseResponse, tags=["Diseases"])
-async def create_disease(disease: DiseaseCreate, _: bool = Depends(verify_api_key)):
+@app.post(
+    "/diseases",
+    responses={200: {"model": DiseaseResponse}},
+    tags=["Diseases"],
+    openapi_extra=request_body_schema(DiseaseCreate)
+)
+async def create_disease(http_request: Request, _: bool = Depends(verify_api_key)):
     """Create a new disease collection"""
-    store = get_vector_store()
-    return store.create_disease(disease.name)
+    disease = await decode_request(http_request, DiseaseCreate)
+    return ORJSONResponse(content=_store.create_disease(disease.name))
 
 
 @app.delete("/diseases/{disease_name}", tags=["Diseases"])
 async def delete_disease(disease_name: str, _: bool = Depends(verify_api_key)):
     """Delete a disease collection"""
-    store = get_vector_store()
-
-    deleted = store.delete_disease(disease_name)
+    deleted = _store.delete_disease(disease_name)
+    invalidate_caches(disease_name)
 
     disease_folder = UPLOAD_DIR / disease_name
-    if disease_folder.exists():
-        shutil.rmtree(disease_folder)
+    await asyncio.to_thread(shutil.rmtree, disease_folder, ignore_errors=True)
 
     if deleted:
         return {"success": True, "message": f"Disease '{disease_name}' deleted successfully"}
@@ -416,13 +578,303 @@ async def delete_disease(disease_name: str, _: bool = Depends(verify_api_key)):
 @app.get("/diseases/{disease_name}/documents", tags=["Diseases"])
 async def get_disease_documents(disease_name: str, _: bool = Depends(verify_api_key)):
     """Get all documents in a disease collection"""
-    store = get_vector_store()
-    return {"success": True, "documents": store.get_disease_documents(disease_name)}
+    return {"success": True, "documents": _store.get_disease_documents(disease_name)}
 
 
 # ==================== Document Upload ====================
 
-@app.post("/upload/{disease_name}", response_model=DocumentResponse, tags=["Documents"])
+def use_batch_embeddings(chunks: List[dict]) -> bool:
+    """Whether a document is large enough to embed through the Batch API"""
+    return (
+        USE_BATCH_EMBEDDINGS
+        and EMBEDDING_BACKEND == "openai"
+        and len(chunks) > BATCH_EMBEDDING_MIN_CHUNKS
+    )
+
+
+# OpenAI errors a batch job outlives instead of discarding the document
+TRANSIENT_OPENAI_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+
+async def ingest_with_batch_embeddings(
+    disease_name: str,
+    document_id: str,
+    chunks: List[dict],
+    filename: str,
+    file_path: Path
+):
+    """
+    Submit chunks to an OpenAI batch job and index them once it completes
+
+    Only chunks missing from the embedding cache are submitted; a document
+    that is mostly cached (e.g. a re-upload) is embedded directly instead.
+    The job is saved under BATCH_JOBS_DIR so a restart resumes polling
+    instead of losing the document.
+    """
+    texts = [c["text"] for c in chunks]
+    cached = await asyncio.to_thread(_store.get_cached_embeddings, texts)
+    missing = [i for i, embedding in enumerate(cached) if embedding is None]
+
+    if len(missing) <= BATCH_EMBEDDING_MIN_CHUNKS:
+        await index_document(disease_name, document_id, chunks, filename, file_path)
+        return
+
+    try:
+        batch_id = await asyncio.to_thread(
+            _store.submit_embedding_batch, [texts[i] for i in missing]
+        )
+    except Exception as e:
+        logger.error("Batch submission failed for document %s: %s", document_id, e)
+        file_path.unlink(missing_ok=True)
+        return
+
+    job = {
+        "batch_id": batch_id,
+        "disease_name": disease_name,
+        "document_id": document_id,
+        "chunks": chunks,
+        "missing": missing,
+        "filename": filename,
+        "file_path": str(file_path)
+    }
+    job_path = BATCH_JOBS_DIR / f"{document_id}.json"
+    _batch_job_locks[document_id] = await asyncio.to_thread(lock_batch_job, job_path, True)
+    await asyncio.to_thread(job_path.write_bytes, orjson.dumps(job))
+
+    await finish_batch_job(job)
+
+
+async def finish_batch_job(job: dict):
+    """
+    Wait for a saved batch job, then add its embeddings to the collection
+
+    Transient API errors while polling are retried; if indexing hits one,
+    the job stays saved and resumes on the next startup.
+    """
+    document_id = job["document_id"]
+    chunks = job["chunks"]
+    texts = [c["text"] for c in chunks]
+    # Jobs saved before cache-aware submission embedded every chunk
+    missing = job.get("missing", list(range(len(chunks))))
+    file_path = Path(job["file_path"])
+    finished = False
+
+    try:
+        try:
+            while True:
+                try:
+                    embeddings = await asyncio.to_thread(
+                        _store.get_embedding_batch_results, job["batch_id"], len(missing)
+                    )
+                except TRANSIENT_OPENAI_ERRORS as e:
+                    logger.warning("Polling batch %s for document %s failed, retrying: %s", job["batch_id"], document_id, e)
+                    embeddings = None
+                if embeddings is not None:
+                    break
+                await asyncio.sleep(BATCH_EMBEDDING_POLL_INTERVAL)
+
+            await asyncio.to_thread(_store.cache_embeddings, [texts[i] for i in missing], embeddings)
+        except RuntimeError as e:
+            # The client was already told the document is processing, so
+            # fall back to synchronous embeddings rather than dropping it
+            logger.warning("Batch embedding failed for document %s, embedding directly: %s", document_id, e)
+
+        # Batch results are cached now, so this only embeds chunks the batch
+        # failed on or the cache has since evicted
+        embeddings = await _store.aget_embeddings(texts)
+
+        await asyncio.to_thread(
+            _store.add_document,
+            disease_name=job["disease_name"],
+            document_id=document_id,
+            chunks=chunks,
+            filename=job["filename"],
+            embeddings=embeddings
+        )
+        invalidate_caches(job["disease_name"])
+        finished = True
+    except TRANSIENT_OPENAI_ERRORS as e:
+        logger.error("Batch document %s not indexed, keeping its job to resume on restart: %s", document_id, e)
+    except Exception as e:
+        logger.error("Batch embedding failed for document %s: %s", document_id, e)
+        file_path.unlink(missing_ok=True)
+        finished = True
+    finally:
+        release_batch_job(document_id, finished)
+
+
+# Document id -> locked job file descriptor, held while this process polls
+# the job so other uvicorn workers skip it
+_batch_job_locks: Dict[str, int] = {}
+
+
+def lock_batch_job(path: Path, create: bool = False) -> Optional[int]:
+    """Exclusively lock a batch job file; None if another process holds it"""
+    try:
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0))
+    except FileNotFoundError:
+        return None
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+    # Finished jobs are deleted before their lock is released
+    if not path.exists():
+        os.close(fd)
+        return None
+    return fd
+
+
+def release_batch_job(document_id: str, finished: bool):
+    """Unlock a batch job, deleting its saved file first if it is finished"""
+    if finished:
+        (BATCH_JOBS_DIR / f"{document_id}.json").unlink(missing_ok=True)
+    fd = _batch_job_locks.pop(document_id, None)
+    if fd is not None:
+        os.close(fd)
+
+
+def claim_batch_jobs() -> List[dict]:
+    """Saved batch jobs no other worker is polling, locked for this process"""
+    jobs = []
+    for path in BATCH_JOBS_DIR.glob("*.json"):
+        fd = lock_batch_job(path)
+        if fd is None:
+            continue
+        job = orjson.loads(path.read_bytes())
+        _batch_job_locks[job["document_id"]] = fd
+        jobs.append(job)
+    return jobs
+
+
+async def index_document(
+    disease_name: str,
+    document_id: str,
+    chunks: List[dict],
+    filename: str,
+    file_path: Path
+):
+    """Embed and add a single queued document, overlapping its writes with embedding"""
+    try:
+        await _store.add_document_async(
+            disease_name=disease_name,
+            document_id=document_id,
+            chunks=chunks,
+            filename=filename
+        )
+        invalidate_caches(disease_name)
+    except Exception as e:
+        logger.error("Indexing failed for document %s: %s", document_id, e)
+        file_path.unlink(missing_ok=True)
+
+
+async def ingest_documents(jobs: List[tuple]):
+    """
+    Embed the chunks of several queued documents together, then add each
+    document to its collection
+
+    If the shared embedding round fails, each document is retried on its
+    own so one bad upload doesn't discard the others.
+
+    Args:
+        jobs: (disease_name, document_id, chunks, filename, file_path) tuples
+    """
+    if len(jobs) == 1:
+        await index_document(*jobs[0])
+        return
+
+    try:
+        embeddings = await _store.aget_embeddings([
+            chunk["text"] for _, _, chunks, _, _ in jobs for chunk in chunks
+        ])
+    except Exception as e:
+        logger.warning("Embedding failed for %d documents, retrying each: %s", len(jobs), e)
+        await asyncio.gather(*(index_document(*job) for job in jobs))
+        return
+
+    offset = 0
+    for disease_name, document_id, chunks, filename, file_path in jobs:
+        try:
+            await asyncio.to_thread(
+                _store.add_document,
+                disease_name=disease_name,
+                document_id=document_id,
+                chunks=chunks,
+                filename=filename,
+                embeddings=embeddings[offset:offset + len(chunks)]
+            )
+            invalidate_caches(disease_name)
+        except Exception as e:
+            logger.error("Indexing failed for document %s: %s", document_id, e)
+            file_path.unlink(missing_ok=True)
+        offset += len(chunks)
+
+
+async def ingestion_worker(ingest_queue: asyncio.Queue):
+    """
+    Index queued documents, gathering documents that arrive within
+    INGEST_BATCH_WINDOW into one embedding round of up to
+    INGEST_BATCH_TEXTS chunks
+    """
+    loop = asyncio.get_running_loop()
+
+    while True:
+        jobs = [await ingest_queue.get()]
+        text_count = len(jobs[0][2])
+        deadline = loop.time() + INGEST_BATCH_WINDOW
+
+        while text_count < INGEST_BATCH_TEXTS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                job = await asyncio.wait_for(ingest_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            jobs.append(job)
+            text_count += len(job[2])
+
+        try:
+            await ingest_documents(jobs)
+        except Exception:
+            # Keep the worker alive so the queue keeps draining
+            logger.exception("Ingestion failed for %d documents", len(jobs))
+        finally:
+            for _ in jobs:
+                ingest_queue.task_done()
+
+
+def pending_ingest_response(
+    document_id: str,
+    filename: str,
+    disease_name: str,
+    chunk_count: int,
+    **extra
+) -> JSONResponse:
+    """202 response for a document accepted for background indexing"""
+    return JSONResponse(
+        status_code=202,
+        content={
+            "success": True,
+            "document_id": document_id,
+            "filename": filename,
+            "disease": disease_name,
+            "chunks_added": 0,
+            "chunks_pending": chunk_count,
+            "status": "processing",
+            **extra
+        }
+    )
+
+
+@app.post("/upload/{disease_name}", status_code=202, responses={202: {"model": DocumentResponse}}, tags=["Documents"])
 async def upload_document(
     disease_name: str,
     file: UploadFile = File(...),
@@ -433,6 +885,12 @@ async def upload_document(
 
     Supported formats: PDF, JSON, PNG, JPG, JPEG, GIF, MD, TXT
 
+    Documents are indexed in the background: the response is 202 with
+    `status: "processing"` and `chunks_pending`, and the document becomes
+    searchable once its chunks are embedded. Large documents (more than 64
+    chunks) are embedded through the OpenAI Batch API, which can take
+    up to 24h.
+
     **n8n Setup:**
     1. Add HTTP Request node
     2. Method: POST
@@ -444,41 +902,38 @@ async def upload_document(
     if file_ext not in SUPPORTED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type: {file_ext}. Supported: {list(SUPPORTED_EXTENSIONS)}"
+            detail=f"Unsupported file type: {file_ext}. Supported: {sorted(SUPPORTED_EXTENSIONS)}"
         )
 
-    content = await file.read()
     document_id = str(uuid.uuid4())
 
     disease_folder = UPLOAD_DIR / disease_name
     disease_folder.mkdir(parents=True, exist_ok=True)
 
+    # Stream the upload to disk in 1 MB chunks instead of buffering it in memory
     file_path = disease_folder / f"{document_id}_{file.filename}"
-    with open(file_path, 'wb') as f:
-        f.write(content)
 
-    try:
-        processor = get_processor()
-        result = processor.process_document(
-            file_path=Path(file.filename),
-            file_content=content
-        )
+    def save_upload():
+        with open(file_path, 'wb') as f:
+            shutil.copyfileobj(file.file, f, length=1024 * 1024)
 
-        store = get_vector_store()
-        chunks_added = store.add_document(
-            disease_name=disease_name,
-            document_id=document_id,
-            chunks=result["chunks"],
-            filename=file.filename
-        )
+    await asyncio.to_thread(save_upload)
 
-        return {
-            "success": True,
-            "document_id": document_id,
-            "filename": file.filename,
-            "disease": disease_name,
-            "chunks_added": chunks_added
-        }
+    try:
+        result = await _processor.process_document(file_path=file_path)
+
+        if use_batch_embeddings(result["chunks"]):
+            start_batch_task(ingest_with_batch_embeddings(
+                disease_name, document_id, result["chunks"], file.filename, file_path
+            ))
+        else:
+            await _ingest_queue.put(
+                (disease_name, document_id, result["chunks"], file.filename, file_path)
+            )
+
+        return pending_ingest_response(
+            document_id, file.filename, disease_name, len(result["chunks"])
+        )
 
     except Exception as e:
         if file_path.exists():
@@ -486,7 +941,19 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/upload/{disease_name}/url", tags=["Documents"])
+# File extension for a downloaded document without one, by media type
+CONTENT_TYPE_EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "application/json": ".json",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/gif": ".gif",
+    "text/markdown": ".md",
+}
+
+
+@app.post("/upload/{disease_name}/url", status_code=202, tags=["Documents"])
 async def upload_from_url(
     disease_name: str,
     url: str = Query(..., description="URL to fetch document from"),
@@ -501,66 +968,66 @@ async def upload_from_url(
     2. Method: POST
     3. URL: `http://your-server:8000/upload/diabetes/url?url=https://example.com/doc.pdf`
     """
+    file_path = None
     try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            response = await client.get(url)
+        async with app.state.http.stream("GET", url, timeout=URL_FETCH_TIMEOUT) as response:
             response.raise_for_status()
-            content = response.content
 
-        # Determine filename
-        if not filename:
-            filename = url.split("/")[-1].split("?")[0]
+            # Determine filename
             if not filename:
-                filename = "document"
-
-        file_ext = Path(filename).suffix.lower()
-        if not file_ext or file_ext not in SUPPORTED_EXTENSIONS:
-            # Try to detect from content-type
-            content_type = response.headers.get("content-type", "")
-            if "pdf" in content_type:
-                filename += ".pdf"
-            elif "json" in content_type:
-                filename += ".json"
-            elif "png" in content_type:
-                filename += ".png"
-            elif "jpeg" in content_type or "jpg" in content_type:
-                filename += ".jpg"
-            else:
-                filename += ".txt"
-
-        document_id = str(uuid.uuid4())
-        disease_folder = UPLOAD_DIR / disease_name
-        disease_folder.mkdir(parents=True, exist_ok=True)
-
-        file_path = disease_folder / f"{document_id}_{filename}"
-        with open(file_path, 'wb') as f:
-            f.write(content)
-
-        processor = get_processor()
-        result = processor.process_document(
-            file_path=Path(filename),
-            file_content=content
+                filename = url.split("/")[-1].split("?")[0]
+                if not filename:
+                    filename = "document"
+
+            file_ext = Path(filename).suffix.lower()
+            if not file_ext or file_ext not in SUPPORTED_EXTENSIONS:
+                # Try to detect from content-type
+                content_type = response.headers.get("content-type", "")
+                media_type = content_type.split(";", 1)[0].strip().lower()
+                filename += CONTENT_TYPE_EXTENSIONS.get(media_type, ".txt")
+
+            document_id = str(uuid.uuid4())
+            disease_folder = UPLOAD_DIR / disease_name
+            disease_folder.mkdir(parents=True, exist_ok=True)
+
+            # Stream the download to disk in 1 MB chunks instead of buffering it in memory
+            file_path = disease_folder / f"{document_id}_{filename}"
+            with await asyncio.to_thread(open, file_path, 'wb') as f:
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    await asyncio.to_thread(f.write, chunk)
+
+        result = await _processor.process_document(file_path=file_path)
+
+        if use_batch_embeddings(result["chunks"]):
+            start_batch_task(ingest_with_batch_embeddings(
+                disease_name, document_id, result["chunks"], filename, file_path
+            ))
+        else:
+            await _ingest_queue.put(
+                (disease_name, document_id, result["chunks"], filename, file_path)
+            )
+
+        return pending_ingest_response(
+            document_id, filename, disease_name, len(result["chunks"]),
+            source_url=url
         )
 
-        store = get_vector_store()
-        chunks_added = store.add_document(
-            disease_name=disease_name,
-            document_id=document_id,
-            chunks=result["chunks"],
-            filename=filename
-        )
-
-        return {
-            "success": True,
-            "document_id": document_id,
-            "filename": filename,
-            "disease": disease_name,
-            "chunks_added": chunks_added,
-            "source_url": url
-        }
-
     except httpx.HTTPError as e:
+        if file_path is not None:
+            file_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail=f"Failed to fetch URL: {str(e)}")
+    except Exception as e:
+        if file_path is not None:
+            file_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def remove_document_files(disease_name: str, document_id: str):
+    """Delete a document's uploaded files from disk"""
+    disease_folder = UPLOAD_DIR / disease_name
+    if disease_folder.exists():
+        for file in disease_folder.glob(f"{document_id}_*"):
+            file.unlink(missing_ok=True)
 
 
 @app.delete("/documents/{disease_name}/{document_id}", tags=["Documents"])
@@ -570,13 +1037,10 @@ async def delete_document(
     _: bool = Depends(verify_api_key)
 ):
     """Delete a document from a disease collection"""
-    store = get_vector_store()
-    deleted = store.delete_document(disease_name, document_id)
+    deleted = _store.delete_document(disease_name, document_id)
+    invalidate_caches(disease_name)
 
-    disease_folder = UPLOAD_DIR / disease_name
-    if disease_folder.exists():
-        for file in disease_folder.glob(f"{document_id}_*"):
-            file.unlink()
+    await asyncio.to_thread(remove_document_files, disease_name, document_id)
 
     if deleted:
         return {"success": True, "message": f"Document '{document_id}' deleted"}
@@ -585,8 +1049,13 @@ async def delete_document(
 
 # ==================== RAG Query ====================
 
-@app.post("/query", response_model=QueryResponse, tags=["Query"])
-async def query_rag(request: QueryRequest, _: bool = Depends(verify_api_key)):
+@app.post(
+    "/query",
+    responses={200: {"model": QueryResponse}},
+    tags=["Query"],
+    openapi_extra=request_body_schema(QueryRequest)
+)
+async def query_rag(http_request: Request, _: bool = Depends(verify_api_key)):
     """
     Query the RAG system with full options
 
@@ -596,16 +1065,17 @@ async def query_rag(request: QueryRequest, _: bool = Depends(verify_api_key)):
         use_verification: Enable agentic verification (default: True)
         max_attempts: Max verification attempts (default: 5)
     """
+    request = await decode_request(http_request, QueryRequest)
+
     if request.use_verification:
-        verifier = get_agentic_verifier()
-        result = verifier.agentic_query(
+        result = await _verifier.agentic_query(
             disease_name=request.disease,
             query=request.query,
             max_attempts=request.max_attempts
         )
     else:
-        engine = get_rag_engine()
-        result = engine.query(
+        result = await asyncio.to_thread(
+            _engine.query,
             disease_name=request.disease,
             query=request.query
         )
@@ -613,7 +1083,40 @@ async def query_rag(request: QueryRequest, _: bool = Depends(verify_api_key)):
         result["confidence"] = 0.0
         result["attempts"] = None
 
-    return {"success": True, **result}
+    # Same fields as QueryResponse, serialized without response validation
+    return ORJSONResponse(content={
+        "success": True,
+        "answer": result["answer"],
+        "verified": result["verified"],
+        "confidence": result["confidence"],
+        "references": public_references(result["references"]),
+        "disease": result["disease"],
+        "attempts": result.get("attempts"),
+        "warning": result.get("warning")
+    })
+
+
+@app.post("/query/stream", tags=["Query"], openapi_extra=request_body_schema(QueryRequest))
+async def query_stream(http_request: Request, _: bool = Depends(verify_api_key)):
+    """
+    Stream an unverified answer as server-sent events
+
+    Each event carries a JSON object: "delta" events with answer text as it
+    is generated, then one "done" event with the references.
+    """
+    request = await decode_request(http_request, QueryRequest)
+
+    def events():
+        for event in _engine.stream_answer(disease_name=request.disease, query=request.query):
+            if "references" in event:
+                event["references"] = public_references(event["references"])
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/query/simple", tags=["Query"])
@@ -623,9 +1126,12 @@ async def simple_query(
     _: bool = Depends(verify_api_key)
 ):
     """Simple query endpoint for form submissions"""
-    engine = get_rag_engine()
-    result = engine.query(disease_name=disease, query=query)
-    return {"success": True, **result}
+    result = await asyncio.to_thread(_engine.query, disease_name=disease, query=query)
+    return ORJSONResponse(content={
+        "success": True,
+        **result,
+        "references": public_references(result["references"])
+    })
 
 
 # ==================== Frontend ====================
@@ -645,4 +1151,11 @@ if FRONTEND_DIR.exists():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=HOST, port=PORT)
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        loop="uvloop",
+        http="httptools",
+        workers=WORKERS
+    )
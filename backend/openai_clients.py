@@ -0,0 +1,46 @@
+"""
+Shared OpenAI clients backed by pooled keep-alive HTTP connections
+"""
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from config import (
+    OPENAI_API_KEY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT
+)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+# Singleton instances
+_client = None
+_async_client = None
+
+def get_openai_client() -> OpenAI:
+    """Get or create the shared synchronous OpenAI client"""
+    global _client
+    if _client is None:
+        http_client = httpx.Client(http2=True, limits=_limits(), timeout=_timeout())
+        _client = OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+    return _client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get or create the shared asynchronous OpenAI client"""
+    global _async_client
+    if _async_client is None:
+        http_client = httpx.AsyncClient(http2=True, limits=_limits(), timeout=_timeout())
+        _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+    return _async_client
@@ -1,29 +1,233 @@
 """
 RAG Engine for retrieval and answer generation
 """
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
+import numba
+import numpy as np
 
 from config import (
-    OPENAI_API_KEY,
     GENERATION_MODEL,
-    TOP_K_RETRIEVAL
+    TOP_K_RETRIEVAL,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+    EXACT_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_SIZE
 )
-from vector_store import get_vector_store
+from openai_clients import get_openai_client
+from vector_store import VectorStore, get_vector_store
+
+# Citation markers the generation prompt asks for, e.g. "[Source 3]"
+SOURCE_CITATION_RE = re.compile(r"\[Source (\d+)\]")
+
+
+# Invariant rules come first so every generation request shares the same
+# prompt prefix, which OpenAI's automatic prompt caching can reuse
+GENERATION_RULES = """You are a precise medical information assistant.
+
+CRITICAL RULES:
+1. ONLY use information explicitly stated in the provided context
+2. If the answer is not in the context, say "I cannot find this information in the provided documents"
+3. NEVER make assumptions or add information from general knowledge
+4. Always cite sources using [Source N] format
+5. Be precise and factual - medical accuracy is critical
+6. If information is partial or unclear, acknowledge the limitation"""
+
+SYSTEM_PROMPT = GENERATION_RULES + """
+
+You specialize in {disease_name}."""
+
+
+@lru_cache(maxsize=64)
+def _render_system_prompt(disease_name: str) -> str:
+    """System prompt for a disease; diseases are few, so renders are cached"""
+    return SYSTEM_PROMPT.format(disease_name=disease_name)
+
+
+def _preview(text: str, limit: int) -> str:
+    """First limit characters of text, with an ellipsis if truncated"""
+    return text if len(text) <= limit else f"{text[:limit]}..."
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _argmax_cosine(query_vec: np.ndarray, matrix: np.ndarray) -> Tuple[int, float]:
+    """Index and score of the row of a normalized matrix closest to query_vec"""
+    scores = np.empty(matrix.shape[0], dtype=np.float32)
+    for i in numba.prange(matrix.shape[0]):
+        score = 0.0
+        for j in range(matrix.shape[1]):
+            score += matrix[i, j] * query_vec[j]
+        scores[i] = score
+    best = np.argmax(scores)
+    return best, scores[best]
+
+
+class _CachePartition:
+    """Normalized query embeddings of one cache slice, stored as matrix rows"""
+    __slots__ = ("matrix", "ids", "rows")
+
+    def __init__(self, dim: int, capacity: int):
+        self.matrix = np.empty((capacity, dim), dtype=np.float32)
+        self.ids: List[int] = []          # row -> entry id
+        self.rows: Dict[int, int] = {}    # entry id -> row
+
+    def append(self, entry_id: int, vec: np.ndarray):
+        count = len(self.ids)
+        if count == self.matrix.shape[0]:
+            grown = np.empty((count * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:count] = self.matrix
+            self.matrix = grown
+        self.matrix[count] = vec
+        self.ids.append(entry_id)
+        self.rows[entry_id] = count
+
+    def remove(self, entry_id: int):
+        # Swap the last row into the freed slot so live rows stay contiguous
+        row = self.rows.pop(entry_id)
+        last_id = self.ids.pop()
+        if last_id != entry_id:
+            self.matrix[row] = self.matrix[len(self.ids)]
+            self.ids[row] = last_id
+            self.rows[last_id] = row
+
+
+class SemanticCache:
+    """
+    LRU cache of RAG responses keyed by query embedding similarity
+
+    A cached response is reused when a new query's embedding has cosine
+    similarity above the threshold with a cached query for the same
+    disease, so repeated and lightly reworded questions skip retrieval
+    and generation.
+    """
+
+    # Initial rows per partition; matrices double when full
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+
+        # entry id -> (slice key, response)
+        self._entries: "OrderedDict[int, Tuple[Tuple, Dict[str, Any]]]" = OrderedDict()
+        # slice key -> embeddings of its entries, updated in place
+        self._partitions: Dict[Tuple, _CachePartition] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        return vec / (np.linalg.norm(vec) + 1e-12)
+
+    def _remove(self, key: Tuple, entry_id: int):
+        partition = self._partitions[key]
+        partition.remove(entry_id)
+        if not partition.ids:
+            del self._partitions[key]
+
+    def lookup(self, key: Tuple, embedding: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """Return a cached response for a similar query, if any"""
+        query_vec = self._normalize(embedding)
+
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                return None
+
+            best, score = _argmax_cosine(query_vec, partition.matrix[:len(partition.ids)])
+            if score < self.threshold:
+                return None
+
+            entry_id = partition.ids[best]
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id][1]
+
+    def add(self, key: Tuple, embedding: Sequence[float], response: Dict[str, Any]):
+        """Cache a response under its query embedding"""
+        query_vec = self._normalize(embedding)
+
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _CachePartition(query_vec.shape[0], self.INITIAL_CAPACITY)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, response)
+            partition.append(entry_id, query_vec)
+
+            while len(self._entries) > self.max_entries:
+                evicted_id, (evicted_key, _) = self._entries.popitem(last=False)
+                self._remove(evicted_key, evicted_id)
+
+    def invalidate(self, disease_name: str):
+        """Drop every cached response for a disease"""
+        with self._lock:
+            for key in [k for k in self._partitions if k[0] == disease_name]:
+                for entry_id in self._partitions.pop(key).ids:
+                    del self._entries[entry_id]
 
 
 class RAGEngine:
     """Retrieval-Augmented Generation Engine"""
 
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = get_openai_client()
         self.vector_store = get_vector_store()
+        self.semantic_cache = SemanticCache()
+
+        # Compile the similarity kernel now rather than on the first lookup,
+        # which would hold the cache lock for the whole compile
+        _argmax_cosine(np.ones(1, dtype=np.float32), np.ones((1, 1), dtype=np.float32))
+
+        # Exact-match tier checked before embedding the query; keys carry a
+        # per-disease version so invalidation is a counter bump
+        self._exact_cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._disease_versions: Dict[str, int] = {}
+        self._exact_lock = threading.Lock()
+
+        # Query embeddings in memory, in front of the vector store's disk cache
+        self._query_embed_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embed_lock = threading.Lock()
+
+    def invalidate_disease(self, disease_name: str):
+        """Drop cached responses for a disease after its documents change"""
+        # Keyed by collection name, so every spelling of a disease shares entries
+        collection_name = VectorStore._sanitize_name(disease_name)
+        with self._exact_lock:
+            self._disease_versions[collection_name] = self._disease_versions.get(collection_name, 0) + 1
+        self.semantic_cache.invalidate(collection_name)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing recent embeddings of identical queries"""
+        key = hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+        with self._embed_lock:
+            cached = self._query_embed_cache.get(key)
+            if cached is not None:
+                self._query_embed_cache.move_to_end(key)
+                return cached
+
+        embedding = np.asarray(self.vector_store.get_embedding(query), dtype=np.float32)
+
+        with self._embed_lock:
+            self._query_embed_cache[key] = embedding
+            if len(self._query_embed_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embed_cache.popitem(last=False)
+
+        return embedding
 
     def retrieve(
         self,
         disease_name: str,
         query: str,
-        top_k: int = None
+        top_k: int = None,
+        include_embeddings: bool = False,
+        query_embedding: Optional[np.ndarray] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant context from vector store
@@ -32,6 +236,8 @@ class RAGEngine:
             disease_name: Disease to search in
             query: User query
             top_k: Number of chunks to retrieve
+            include_embeddings: Also return chunk embeddings (for reranking)
+            query_embedding: Precomputed embedding of the query
 
         Returns:
             List of relevant chunks with metadata
@@ -39,14 +245,57 @@ class RAGEngine:
         if top_k is None:
             top_k = TOP_K_RETRIEVAL
 
-        results = self.vector_store.search(
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        results = self.vector_store.search_by_embedding(
             disease_name=disease_name,
-            query=query,
-            top_k=top_k
+            query_embedding=query_embedding,
+            top_k=top_k,
+            include_embeddings=include_embeddings
         )
 
         return results
 
+    def rerank(
+        self,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        top_k: int = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank previously retrieved chunks against a (possibly refined) query
+
+        Uses cosine similarity between the query embedding and the chunk
+        embeddings returned by retrieve(..., include_embeddings=True), so a
+        retry can pick a new top-k without another vector store search.
+
+        Args:
+            query: Query to rank against
+            candidates: Retrieved chunks including their embeddings
+            top_k: Number of chunks to keep
+
+        Returns:
+            Top chunks, best first, with updated scores
+        """
+        if top_k is None:
+            top_k = TOP_K_RETRIEVAL
+
+        if not candidates:
+            return []
+
+        query_vec = self.embed_query(query)
+        chunk_vecs = np.asarray([c["embedding"] for c in candidates], dtype=np.float32)
+
+        scores = chunk_vecs @ query_vec
+        scores /= np.linalg.norm(chunk_vecs, axis=1) * np.linalg.norm(query_vec) + 1e-12
+
+        ranked = []
+        for i in np.argsort(-scores)[:top_k]:
+            ranked.append({**candidates[i], "score": float(scores[i])})
+
+        return ranked
+
     def generate_answer(
         self,
         query: str,
@@ -66,25 +315,44 @@ class RAGEngine:
         Returns:
             Generated answer with references
         """
-        # Build context string with references
-        context_parts = []
-        for i, chunk in enumerate(context):
-            source = chunk['metadata'].get('filename', 'Unknown')
-            context_parts.append(f"[Source {i + 1}: {source}]\n{chunk['text']}")
+        messages = self._build_messages(query, context, disease_name, additional_instructions)
 
-        context_str = "\n\n---\n\n".join(context_parts)
+        response = self.client.chat.completions.create(
+            model=GENERATION_MODEL,
+            messages=messages,
+            temperature=0.1,  # Low temperature for factual accuracy
+            max_tokens=2048
+        )
 
-        system_prompt = f"""You are a precise medical information assistant specialized in {disease_name}.
+        answer = response.choices[0].message.content
 
-CRITICAL RULES:
-1. ONLY use information explicitly stated in the provided context
-2. If the answer is not in the context, say "I cannot find this information in the provided documents"
-3. NEVER make assumptions or add information from general knowledge
-4. Always cite sources using [Source N] format
-5. Be precise and factual - medical accuracy is critical
-6. If information is partial or unclear, acknowledge the limitation
+        # Extract references
+        references = self._extract_references(answer, context)
+
+        return {
+            "answer": answer,
+            "references": references,
+            "context_used": len(context),
+            "disease": disease_name
+        }
 
-{additional_instructions or ''}"""
+    def _build_messages(
+        self,
+        query: str,
+        context: List[Dict[str, Any]],
+        disease_name: str,
+        additional_instructions: str = None
+    ) -> List[Dict[str, str]]:
+        """Build the chat messages for answering a query from context"""
+        # Build context string with references
+        context_str = "\n\n---\n\n".join([
+            f"[Source {i}: {chunk['metadata'].get('filename', 'Unknown')}]\n{chunk['text']}"
+            for i, chunk in enumerate(context, start=1)
+        ])
+
+        system_prompt = _render_system_prompt(disease_name)
+        if additional_instructions:
+            system_prompt = f"{system_prompt}\n\n{additional_instructions}"
 
         user_prompt = f"""Context from {disease_name} documents:
 
@@ -96,26 +364,64 @@ Question: {query}
 
 Please provide a precise answer based ONLY on the context above. Include [Source N] citations for every fact you state."""
 
-        response = self.client.chat.completions.create(
-            model=GENERATION_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.1,  # Low temperature for factual accuracy
-            max_tokens=2048
-        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
-        answer = response.choices[0].message.content
+    def stream_answer(
+        self,
+        disease_name: str,
+        query: str,
+        top_k: int = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Retrieve context and stream the generated answer
 
-        # Extract references
-        references = self._extract_references(answer, context)
+        Yields {"type": "delta", "content": ...} events as tokens arrive,
+        then a single {"type": "done", ...} event with the references
+        extracted from the complete answer.
 
-        return {
-            "answer": answer,
-            "references": references,
+        Args:
+            disease_name: Disease to query
+            query: User question
+            top_k: Number of chunks to retrieve
+
+        Yields:
+            Stream events
+        """
+        context = self.retrieve(disease_name, query, top_k)
+
+        if not context:
+            no_context = self.answer_from_context(disease_name, query, context)
+            yield {"type": "delta", "content": no_context.pop("answer")}
+            yield {"type": "done", **no_context}
+            return
+
+        stream = self.client.chat.completions.create(
+            model=GENERATION_MODEL,
+            messages=self._build_messages(query, context, disease_name),
+            temperature=0.1,
+            max_tokens=2048,
+            stream=True
+        )
+
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield {"type": "delta", "content": delta}
+
+        answer = "".join(parts)
+        yield {
+            "type": "done",
+            "references": self._extract_references(answer, context),
             "context_used": len(context),
-            "disease": disease_name
+            "disease": disease_name,
+            "status": "success"
         }
 
     def _extract_references(
@@ -124,19 +430,25 @@ Please provide a precise answer based ONLY on the context above. Include [Source
         context: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """Extract and format references from the answer"""
+        cited = {int(n) for n in SOURCE_CITATION_RE.findall(answer)}
+
         references = []
-        seen_sources = set()
-
-        for i, chunk in enumerate(context):
-            source_marker = f"[Source {i + 1}]"
-            if source_marker in answer and i not in seen_sources:
-                seen_sources.add(i)
-                references.append({
-                    "source_id": i + 1,
-                    "filename": chunk['metadata'].get('filename', 'Unknown'),
-                    "excerpt": chunk['text'][:200] + "..." if len(chunk['text']) > 200 else chunk['text'],
-                    "relevance_score": chunk.get('score', 0)
-                })
+        for source_id in sorted(cited):
+            if not 1 <= source_id <= len(context):
+                continue
+            chunk = context[source_id - 1]
+            text = chunk['text']
+
+            # Sliced once; excerpt_200 is the bare prefix the n8n endpoints
+            # return, and is stripped from every other payload
+            excerpt_200 = text[:200]
+            references.append({
+                "source_id": source_id,
+                "filename": chunk['metadata'].get('filename', 'Unknown'),
+                "excerpt": excerpt_200 if len(text) <= 200 else f"{excerpt_200}...",
+                "excerpt_200": excerpt_200,
+                "relevance_score": chunk.get('score', 0)
+            })
 
         return references
 
@@ -157,9 +469,59 @@ Please provide a precise answer based ONLY on the context above. Include [Source
         Returns:
             Complete response with answer and references
         """
-        # Retrieve relevant context
-        context = self.retrieve(disease_name, query, top_k)
+        # Reuse the response of an identical earlier query
+        collection_name = VectorStore._sanitize_name(disease_name)
+        with self._exact_lock:
+            # Captured before any work, so an answer generated across an
+            # invalidation is cached under the superseded version
+            version = self._disease_versions.get(collection_name, 0)
+            exact_key = (
+                collection_name,
+                version,
+                re.sub(r"\s+", " ", query.strip().lower()),
+                top_k
+            )
+            cached = self._exact_cache.get(exact_key)
+            if cached is not None:
+                self._exact_cache.move_to_end(exact_key)
+                return dict(cached)
+
+        # Reuse the response of a near-identical earlier query
+        cache_key = (collection_name, version, top_k)
+        query_embedding = self.embed_query(query)
+        result = self.semantic_cache.lookup(cache_key, query_embedding)
+
+        if result is None:
+            # Retrieve relevant context
+            context = self.retrieve(disease_name, query, top_k, query_embedding=query_embedding)
+
+            result = self.answer_from_context(disease_name, query, context)
+            self.semantic_cache.add(cache_key, query_embedding, result)
+
+        with self._exact_lock:
+            self._exact_cache[exact_key] = result
+            if len(self._exact_cache) > EXACT_CACHE_SIZE:
+                self._exact_cache.popitem(last=False)
+
+        return dict(result)
+
+    def answer_from_context(
+        self,
+        disease_name: str,
+        query: str,
+        context: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Generate a response from already retrieved context
+
+        Args:
+            disease_name: Disease to query
+            query: User question
+            context: Retrieved chunks
 
+        Returns:
+            Complete response with answer and references
+        """
         if not context:
             return {
                 "answer": "No documents found for this disease. Please upload relevant documents first.",
@@ -174,7 +536,7 @@ Please provide a precise answer based ONLY on the context above. Include [Source
         result["status"] = "success"
         result["retrieved_chunks"] = [
             {
-                "text": c['text'][:300] + "..." if len(c['text']) > 300 else c['text'],
+                "text": _preview(c['text'], 300),
                 "score": c.get('score', 0),
                 "filename": c['metadata'].get('filename', 'Unknown')
             }
@@ -2,41 +2,163 @@
 Vector Store using ChromaDB with per-disease collections
 """
 import os
+import re
+import json
+import asyncio
+import logging
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Union
 import chromadb
+import numpy as np
+import diskcache
+import openai
+from cachetools import TTLCache
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from chromadb.config import Settings
-from openai import OpenAI
 
 from config import (
-    OPENAI_API_KEY,
     EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    FASTEMBED_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_RETRY_ATTEMPTS,
     VECTOR_DB_DIR,
+    CHROMA_HOST,
+    CHROMA_PORT,
     TOP_K_RETRIEVAL,
-    DATA_DIR
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_BATCH_SIZE,
+    HNSW_SYNC_THRESHOLD,
+    DATA_DIR,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_SIZE_LIMIT,
+    LISTING_CACHE_TTL,
+    LIST_DISEASES_WORKERS
 )
+from openai_clients import get_openai_client, get_async_openai_client
+
+logger = logging.getLogger("ragapi.vector_store")
+
+# Characters not allowed in collection names; matching runs in C
+NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+# Retry embedding requests on rate limits and transient failures with
+# jittered exponential backoff, so one bad response doesn't fail an upload.
+# The SDK's own retries are disabled on these calls so attempts don't multiply
+_retry_embeddings = retry(
+    retry=retry_if_exception_type((
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    )),
+    stop=stop_after_attempt(EMBEDDING_RETRY_ATTEMPTS),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    reraise=True
+)
+
+
+def _decode_embedding(data: str) -> List[float]:
+    """Decode a base64 embedding (little-endian float32) from the OpenAI API"""
+    return np.frombuffer(base64.b64decode(data), dtype="<f4").tolist()
+
+
+def _pack_embedding(embedding: Sequence[float]) -> bytes:
+    """Raw little-endian float32 bytes for the embedding cache"""
+    return np.asarray(embedding, dtype="<f4").tobytes()
+
+
+def _unpack_embedding(data: Any) -> Optional[List[float]]:
+    """Read an embedding cache value (raw float32 bytes, or a pickled list from older caches)"""
+    if isinstance(data, bytes):
+        return np.frombuffer(data, dtype="<f4").tolist()
+    return data
 
 
 class VectorStore:
     """Manage vector embeddings per disease using ChromaDB"""
 
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = get_openai_client()
+        self.aclient = get_async_openai_client()
+
+        # Embeddings requests in flight across all concurrent uploads
+        self._embed_limiter = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+        # Optional local embedding model; imported lazily so fastembed is
+        # only required when selected
+        self.local_model = None
+        self.embedding_model = EMBEDDING_MODEL
+        if EMBEDDING_BACKEND == "fastembed":
+            from fastembed import TextEmbedding
+            self.local_model = TextEmbedding(model_name=FASTEMBED_MODEL, threads=os.cpu_count())
+            self.embedding_model = FASTEMBED_MODEL
+
+        # Embeddings keyed by content hash, shared across documents
+        self.embedding_cache = diskcache.Cache(
+            str(EMBEDDING_CACHE_DIR),
+            size_limit=EMBEDDING_CACHE_SIZE_LIMIT
+        )
 
-        # Ensure vector DB directory exists
-        VECTOR_DB_DIR.mkdir(parents=True, exist_ok=True)
+        settings = Settings(
+            anonymized_telemetry=False,
+            allow_reset=True
+        )
 
-        # Initialize ChromaDB with persistent storage
-        self.chroma_client = chromadb.PersistentClient(
-            path=str(VECTOR_DB_DIR),
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
+        if CHROMA_HOST:
+            # Shared Chroma server
+            self.chroma_client = chromadb.HttpClient(
+                host=CHROMA_HOST,
+                port=CHROMA_PORT,
+                settings=settings
+            )
+        else:
+            # Ensure vector DB directory exists
+            VECTOR_DB_DIR.mkdir(parents=True, exist_ok=True)
+
+            # Initialize ChromaDB with persistent storage
+            self.chroma_client = chromadb.PersistentClient(
+                path=str(VECTOR_DB_DIR),
+                settings=settings
             )
-        )
 
-        # Cache for collections
-        self._collections = {}
+        # Cache for collections, pinned up front so first queries skip the lookup
+        self._collections = {col.name: col for col in self.chroma_client.list_collections()}
+
+        # Short-lived disease listings for polling UIs; cleared on every write
+        self._listing_cache = TTLCache(maxsize=8, ttl=LISTING_CACHE_TTL)
+        self._listing_lock = threading.Lock()
+        # Counts collections for list_diseases; created once, not per listing
+        self._count_executor = ThreadPoolExecutor(max_workers=LIST_DISEASES_WORKERS)
+
+        # collection name -> {document id: document info}, loaded lazily per
+        # collection and kept current by add/delete
+        self._doc_index: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._doc_index_lock = threading.Lock()
+
+        # Load each HNSW index in the background so first queries don't pay for it
+        threading.Thread(target=self._warm_indexes, daemon=True).start()
+
+    def _warm_indexes(self):
+        """Run one nearest-neighbour query per collection to load its index"""
+        for collection in list(self._collections.values()):
+            try:
+                sample = collection.get(limit=1, include=["embeddings"])
+                if sample["embeddings"]:
+                    collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1, include=[])
+            except Exception as e:
+                logger.warning("Failed to warm collection %s: %s", collection.name, e)
+
+    def _invalidate_listings(self):
+        with self._listing_lock:
+            self._listing_cache.clear()
 
     def _get_collection(self, disease_name: str) -> chromadb.Collection:
         """Get or create collection for a disease"""
@@ -45,15 +167,25 @@ class VectorStore:
         if collection_name not in self._collections:
             self._collections[collection_name] = self.chroma_client.get_or_create_collection(
                 name=collection_name,
-                metadata={"disease": disease_name, "hnsw:space": "cosine"}
+                metadata={
+                    "disease": disease_name,
+                    "hnsw:space": "cosine",
+                    "hnsw:M": HNSW_M,
+                    "hnsw:construction_ef": HNSW_EF_CONSTRUCTION,
+                    "hnsw:search_ef": HNSW_EF_SEARCH,
+                    "hnsw:batch_size": HNSW_BATCH_SIZE,
+                    "hnsw:sync_threshold": HNSW_SYNC_THRESHOLD
+                }
             )
 
         return self._collections[collection_name]
 
-    def _sanitize_name(self, name: str) -> str:
-        """Sanitize collection name for ChromaDB"""
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _sanitize_name(name: str) -> str:
+        """Sanitize collection name for ChromaDB (memoized; disease names are few)"""
         # ChromaDB collection names must be 3-63 chars, alphanumeric with underscores
-        sanitized = "".join(c if c.isalnum() else "_" for c in name.lower())
+        sanitized = NON_ALNUM_RE.sub("_", name.lower())
         sanitized = sanitized.strip("_")
 
         # Ensure minimum length
@@ -65,18 +197,125 @@ class VectorStore:
 
     def get_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using OpenAI"""
-        response = self.client.embeddings.create(
+        cache_key = self._embedding_key(text)
+        cached = _unpack_embedding(self.embedding_cache.get(cache_key))
+        if cached is not None:
+            return cached
+
+        embedding = self._embed_batch([text])[0]
+        self.embedding_cache.set(cache_key, _pack_embedding(embedding))
+        return embedding
+
+    def get_cached_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings of texts, None for texts not embedded yet"""
+        return [_unpack_embedding(self.embedding_cache.get(self._embedding_key(text))) for text in texts]
+
+    def cache_embeddings(self, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings computed outside get_embeddings, e.g. by a batch job"""
+        for text, embedding in zip(texts, embeddings):
+            self.embedding_cache.set(self._embedding_key(text), _pack_embedding(embedding))
+
+    def get_embeddings(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[List[float]]:
+        """
+        Generate embeddings for many texts with one OpenAI call per batch
+
+        Args:
+            texts: Texts to embed
+            batch_size: Max texts per embeddings request
+
+        Returns:
+            Embeddings in the same order as texts
+        """
+        keys = [self._embedding_key(text) for text in texts]
+        embeddings = [_unpack_embedding(self.embedding_cache.get(key)) for key in keys]
+
+        # Only embed cache misses, batch_size texts per request
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            for i, embedding in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                embeddings[i] = embedding
+                self.embedding_cache.set(keys[i], _pack_embedding(embedding))
+
+        return embeddings
+
+    async def aget_embeddings(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[List[float]]:
+        """
+        Async get_embeddings that sends the batches concurrently
+
+        Args:
+            texts: Texts to embed
+            batch_size: Max texts per embeddings request
+
+        Returns:
+            Embeddings in the same order as texts
+        """
+        if self.local_model is not None:
+            # CPU-bound local inference; nothing to overlap
+            return await asyncio.to_thread(self.get_embeddings, texts, batch_size)
+
+        keys = [self._embedding_key(text) for text in texts]
+        embeddings = await asyncio.to_thread(lambda: [_unpack_embedding(self.embedding_cache.get(key)) for key in keys])
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        async def embed(batch: List[int]):
+            async with self._embed_limiter:
+                batch_embeddings = await self._aembed_openai([texts[i] for i in batch])
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+
+        await asyncio.gather(*(
+            embed(missing[start:start + batch_size])
+            for start in range(0, len(missing), batch_size)
+        ))
+
+        def store_missing():
+            for i in missing:
+                self.embedding_cache.set(keys[i], _pack_embedding(embeddings[i]))
+
+        await asyncio.to_thread(store_missing)
+        return embeddings
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with one request to the configured backend"""
+        if self.local_model is not None:
+            return [embedding.tolist() for embedding in self.local_model.embed(texts)]
+
+        return self._embed_openai(texts)
+
+    @_retry_embeddings
+    def _embed_openai(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.with_options(max_retries=0).embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts,
+            encoding_format="base64"
+        )
+        return [_decode_embedding(item.embedding) for item in response.data]
+
+    @_retry_embeddings
+    async def _aembed_openai(self, texts: List[str]) -> List[List[float]]:
+        response = await self.aclient.with_options(max_retries=0).embeddings.create(
             model=EMBEDDING_MODEL,
-            input=text
+            input=texts,
+            encoding_format="base64"
         )
-        return response.data[0].embedding
+        return [_decode_embedding(item.embedding) for item in response.data]
+
+    def _embedding_key(self, text: str) -> str:
+        """Content hash of text for the embedding cache"""
+        return hashlib.blake2b(
+            f"{self.embedding_model}:{text}".encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
 
     def add_document(
         self,
         disease_name: str,
         document_id: str,
         chunks: List[Dict[str, Any]],
-        filename: str
+        filename: str,
+        embeddings: Optional[List[List[float]]] = None
     ) -> int:
         """
         Add document chunks to disease-specific collection
@@ -86,49 +325,194 @@ class VectorStore:
             document_id: Unique document identifier
             chunks: List of text chunks with metadata
             filename: Original filename
+            embeddings: Precomputed chunk embeddings (e.g. from a batch job)
 
         Returns:
             Number of chunks added
         """
         collection = self._get_collection(disease_name)
 
-        ids = []
-        embeddings = []
-        documents = []
-        metadatas = []
-
-        for chunk in chunks:
-            chunk_id = f"{document_id}_chunk_{chunk['id']}"
-
-            # Generate embedding
-            embedding = self.get_embedding(chunk['text'])
-
-            ids.append(chunk_id)
-            embeddings.append(embedding)
-            documents.append(chunk['text'])
-            metadatas.append({
+        if embeddings is None:
+            embeddings = self.get_embeddings([chunk['text'] for chunk in chunks])
+
+        # Build each field as its own column; per-document values are shared
+        chunk_ids = [chunk['id'] for chunk in chunks]
+        char_counts = [chunk['char_count'] for chunk in chunks]
+        documents = [chunk['text'] for chunk in chunks]
+        id_prefix = f"{document_id}_chunk_"
+        ids = [id_prefix + str(chunk_id) for chunk_id in chunk_ids]
+        metadatas = [
+            {
                 "document_id": document_id,
                 "filename": filename,
-                "chunk_id": chunk['id'],
-                "char_count": chunk['char_count'],
+                "chunk_id": chunk_id,
+                "char_count": char_count,
                 "disease": disease_name
-            })
+            }
+            for chunk_id, char_count in zip(chunk_ids, char_counts)
+        ]
 
-        # Add to collection
-        collection.add(
+        # Upsert so re-ingesting a document replaces its chunks instead of
+        # failing on duplicate ids
+        collection.upsert(
             ids=ids,
             embeddings=embeddings,
             documents=documents,
             metadatas=metadatas
         )
+        self._invalidate_listings()
+
+        with self._doc_index_lock:
+            documents = self._doc_index.get(collection.name)
+            if documents is not None and document_id not in documents:
+                documents[document_id] = {
+                    "document_id": document_id,
+                    "filename": filename,
+                    "disease": disease_name
+                }
+
+        return len(chunks)
+
+    async def add_document_async(
+        self,
+        disease_name: str,
+        document_id: str,
+        chunks: List[Dict[str, Any]],
+        filename: str
+    ) -> int:
+        """
+        Async add_document: embeds chunks with concurrent requests and
+        writes them to the collection on a worker thread
+
+        Chunks are processed in groups, and each group's write overlaps
+        with embedding the next group. If any group fails, the groups
+        already written are deleted so no partial document stays searchable.
+
+        Returns:
+            Number of chunks added
+        """
+        group_size = EMBEDDING_BATCH_SIZE * EMBEDDING_CONCURRENCY
+        pending_write = None
+
+        try:
+            for start in range(0, len(chunks), group_size):
+                group = chunks[start:start + group_size]
+                embed = self.aget_embeddings([chunk['text'] for chunk in group])
+
+                if pending_write is None:
+                    embeddings = await embed
+                else:
+                    embeddings, _ = await asyncio.gather(embed, pending_write)
+
+                pending_write = asyncio.create_task(asyncio.to_thread(
+                    self.add_document,
+                    disease_name=disease_name,
+                    document_id=document_id,
+                    chunks=group,
+                    filename=filename,
+                    embeddings=embeddings
+                ))
+
+            if pending_write is not None:
+                await pending_write
+        except BaseException:
+            # Let an in-flight write land before rolling back, so it can't
+            # re-add chunks after the delete
+            if pending_write is not None:
+                await asyncio.gather(pending_write, return_exceptions=True)
+            await asyncio.to_thread(self.delete_document, disease_name, document_id)
+            raise
 
         return len(chunks)
 
+    def submit_embedding_batch(self, texts: List[str]) -> str:
+        """
+        Submit texts to the OpenAI Batch API for embedding
+
+        Batch jobs cost half as much as synchronous calls but complete
+        asynchronously (within 24h), so they are used for bulk ingestion only.
+
+        Returns:
+            Batch job ID to poll with get_embedding_batch_results
+        """
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {"model": EMBEDDING_MODEL, "input": text, "encoding_format": "base64"}
+            })
+            for i, text in enumerate(texts)
+        ]
+
+        batch_file = self.client.files.create(
+            file=("embeddings.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h"
+        )
+        return batch.id
+
+    def get_embedding_batch_results(self, batch_id: str, count: int) -> Optional[List[List[float]]]:
+        """
+        Fetch embeddings of a finished batch job, in submission order
+
+        Args:
+            batch_id: Job ID from submit_embedding_batch
+            count: Number of texts submitted
+
+        Returns:
+            Embeddings, or None while the batch is still running
+
+        Raises:
+            RuntimeError: If the batch failed, expired or was cancelled, or
+                any of its requests is missing from the output
+        """
+        batch = self.client.batches.retrieve(batch_id)
+
+        if batch.status in {"failed", "expired", "cancelled"}:
+            raise RuntimeError(f"Embedding batch {batch_id} {batch.status}")
+        if batch.status != "completed":
+            return None
+
+        # Failed requests go to error_file_id and are absent from the output
+        if batch.request_counts is not None and batch.request_counts.failed:
+            raise RuntimeError(
+                f"Embedding batch {batch_id}: {batch.request_counts.failed} requests failed "
+                f"(see error file {batch.error_file_id})"
+            )
+        if batch.output_file_id is None:
+            raise RuntimeError(f"Embedding batch {batch_id} completed without output")
+
+        output = self.client.files.content(batch.output_file_id).text
+
+        embeddings = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("error") or record["response"]["status_code"] != 200:
+                raise RuntimeError(f"Embedding batch {batch_id} request {record['custom_id']} failed")
+            embeddings[int(record["custom_id"])] = _decode_embedding(
+                record["response"]["body"]["data"][0]["embedding"]
+            )
+
+        if len(embeddings) != count or not all(i in embeddings for i in range(count)):
+            raise RuntimeError(
+                f"Embedding batch {batch_id} returned {len(embeddings)} of {count} embeddings"
+            )
+
+        return [embeddings[i] for i in range(count)]
+
     def search(
         self,
         disease_name: str,
         query: str,
-        top_k: int = None
+        top_k: int = None,
+        include_embeddings: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Search for relevant chunks in disease collection
@@ -137,6 +521,33 @@ class VectorStore:
             disease_name: Name of the disease to search
             query: Search query
             top_k: Number of results to return
+            include_embeddings: Also return each chunk's embedding
+
+        Returns:
+            List of matching chunks with scores
+        """
+        return self.search_by_embedding(
+            disease_name=disease_name,
+            query_embedding=self.get_embedding(query),
+            top_k=top_k,
+            include_embeddings=include_embeddings
+        )
+
+    def search_by_embedding(
+        self,
+        disease_name: str,
+        query_embedding: Union[np.ndarray, Sequence[float]],
+        top_k: int = None,
+        include_embeddings: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for relevant chunks using a precomputed query embedding
+
+        Args:
+            disease_name: Name of the disease to search
+            query_embedding: Embedding of the search query (float32 array or list)
+            top_k: Number of results to return
+            include_embeddings: Also return each chunk's embedding
 
         Returns:
             List of matching chunks with scores
@@ -147,17 +558,23 @@ class VectorStore:
         collection = self._get_collection(disease_name)
 
         # Check if collection has documents
-        if collection.count() == 0:
+        count = collection.count()
+        if count == 0:
             return []
 
-        # Generate query embedding
-        query_embedding = self.get_embedding(query)
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+
+        # Chroma 0.4 only accepts nested lists of Python floats, so convert the
+        # contiguous float32 row in one C-level tolist() instead of per element
+        query = np.ascontiguousarray(query_embedding, dtype=np.float32).reshape(1, -1)
 
         # Search
         results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=min(top_k, collection.count()),
-            include=["documents", "metadatas", "distances"]
+            query_embeddings=query.tolist(),
+            n_results=min(top_k, count),
+            include=include
         )
 
         # Format results
@@ -171,6 +588,8 @@ class VectorStore:
                     "score": 1 - results['distances'][0][i],  # Convert distance to similarity
                     "distance": results['distances'][0][i]
                 })
+                if include_embeddings:
+                    formatted_results[-1]["embedding"] = results['embeddings'][0][i]
 
         return formatted_results
 
@@ -178,55 +597,82 @@ class VectorStore:
         """Delete all chunks for a document"""
         collection = self._get_collection(disease_name)
 
-        # Get all chunks for this document
+        # Get the ids of all chunks for this document
         results = collection.get(
-            where={"document_id": document_id}
+            where={"document_id": document_id},
+            include=[]
         )
 
         if results['ids']:
             collection.delete(ids=results['ids'])
+            self._invalidate_listings()
+            with self._doc_index_lock:
+                self._doc_index.get(collection.name, {}).pop(document_id, None)
             return True
 
         return False
 
     def list_diseases(self) -> List[Dict[str, Any]]:
         """List all disease collections"""
+        with self._listing_lock:
+            cached = self._listing_cache.get(("diseases",))
+        if cached is not None:
+            return cached
+
         collections = self.chroma_client.list_collections()
-        diseases = []
 
-        for col in collections:
-            collection = self.chroma_client.get_collection(col.name)
-            diseases.append({
+        # Count collections concurrently; each count is a separate Chroma query
+        counts = list(self._count_executor.map(lambda col: col.count(), collections))
+
+        diseases = [
+            {
                 "name": col.name,
                 "display_name": col.metadata.get("disease", col.name) if col.metadata else col.name,
-                "document_count": collection.count()
-            })
+                "document_count": count
+            }
+            for col, count in zip(collections, counts)
+        ]
 
+        with self._listing_lock:
+            self._listing_cache[("diseases",)] = diseases
         return diseases
 
     def get_disease_documents(self, disease_name: str) -> List[Dict[str, Any]]:
         """Get all unique documents in a disease collection"""
-        collection = self._get_collection(disease_name)
+        collection_name = self._sanitize_name(disease_name)
+        with self._doc_index_lock:
+            documents = self._doc_index.get(collection_name)
+            if documents is not None:
+                return list(documents.values())
 
-        # Get all items
-        results = collection.get(include=["metadatas"])
-
-        # Extract unique documents
-        documents = {}
-        for metadata in results['metadatas']:
-            doc_id = metadata.get('document_id')
-            if doc_id and doc_id not in documents:
-                documents[doc_id] = {
-                    "document_id": doc_id,
-                    "filename": metadata.get('filename', 'Unknown'),
-                    "disease": metadata.get('disease', disease_name)
-                }
+        collection = self._get_collection(disease_name)
 
-        return list(documents.values())
+        # Cold start: scan chunk metadata once, then keep the index current.
+        # The scan holds the lock so a write landing mid-scan waits and then
+        # updates the installed index instead of finding none and skipping it
+        with self._doc_index_lock:
+            documents = self._doc_index.get(collection_name)
+            if documents is None:
+                results = collection.get(include=["metadatas"])
+
+                # Extract unique documents
+                documents = {}
+                for metadata in results['metadatas']:
+                    doc_id = metadata.get('document_id')
+                    if doc_id and doc_id not in documents:
+                        documents[doc_id] = {
+                            "document_id": doc_id,
+                            "filename": metadata.get('filename', 'Unknown'),
+                            "disease": metadata.get('disease', disease_name)
+                        }
+                self._doc_index[collection_name] = documents
+
+            return list(documents.values())
 
     def create_disease(self, disease_name: str) -> Dict[str, Any]:
         """Create a new disease collection"""
         collection = self._get_collection(disease_name)
+        self._invalidate_listings()
 
         # Create disease folder for uploads
         disease_folder = DATA_DIR / "uploads" / disease_name
@@ -246,6 +692,9 @@ class VectorStore:
             self.chroma_client.delete_collection(collection_name)
             if collection_name in self._collections:
                 del self._collections[collection_name]
+            self._invalidate_listings()
+            with self._doc_index_lock:
+                self._doc_index.pop(collection_name, None)
             return True
         except Exception:
             return False
@@ -266,7 +266,9 @@ async function uploadFile(file, itemId) {
         if (response.ok) {
             const result = await response.json();
             statusEl.className = 'status success';
-            statusEl.textContent = `${result.chunks_added} chunks`;
+            statusEl.textContent = response.status === 202
+                ? `${result.chunks_pending} chunks (indexing)`
+                : `${result.chunks_added} chunks`;
         } else {
             const error = await response.json();
             statusEl.className = 'status error';